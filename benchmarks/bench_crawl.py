@@ -0,0 +1,173 @@
+''' End-to-end benchmark: runs the Crawler against a local fake cache server
+(benchmarks/fake_cache.py) until the frontier is empty, and reports
+pages/sec, CPU time, peak RSS and the frontier's disk I/O.
+
+    python -m benchmarks.bench_crawl --pages 2000 --threads 8 --latency_ms 20
+    python -m benchmarks.bench_crawl --engine async --parse_processes 2
+    python -m benchmarks.bench_crawl --recrawl --change_rate 0.1
+
+Settings not given on the command line come from config.ini. The crawl runs
+in a temporary directory (kept with --workdir), where the save file, Logs/
+and the REPORT.txt end up. The site graph is deterministic, but the crawl
+order is not: which pages the duplicate and trap detectors see first
+changes which links are followed, so the number of unique pages in the
+report varies a little between runs of the same arguments.
+
+With --recrawl, the crawl keeps a page history and is followed by an
+incremental recrawl of every page (as if all were due) after change_rate of
+the synthetic pages changed.
+'''
+import os
+import time
+import logging
+import resource
+import tempfile
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.fake_cache import add_arguments, make_server
+from crawler import Crawler
+from crawler.async_crawler import AsyncCrawler
+from crawler.parse_pool import get_parse_pool
+from report import Report
+from utils.config import Config
+from utils.download import stats as download_stats
+from utils.metrics import metrics
+
+
+def read_io():
+    # Bytes read from and written to disk by this process, where available.
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":") for line in f if ":" in line)
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def files_size(save_file):
+    directory = os.path.dirname(save_file) or "."
+    name = os.path.basename(save_file)
+    return sum(
+        os.path.getsize(os.path.join(directory, entry))
+        for entry in os.listdir(directory) if entry.startswith(name))
+
+
+def make_config(args, cache_server, seed_urls, workdir):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    config.cache_server = cache_server
+    config.seed_urls = seed_urls
+    config.save_file = os.path.join(workdir, os.path.basename(config.save_file))
+    config.time_delay = args.politeness
+    config.engine = args.engine or config.engine
+    # The summary below reads the metrics.
+    config.metrics = True
+    if args.robots:
+        config.robots = True
+    if args.threads:
+        config.threads_count = args.threads
+    if args.parse_processes is not None:
+        config.parse_processes = args.parse_processes
+    if args.store:
+        config.save_store = args.store
+    if args.archive is not None:
+        config.archive = args.archive and os.path.abspath(args.archive)
+    if args.recrawl:
+        # Every page is due again right away.
+        config.page_history = True
+        config.recrawl_interval = config.recrawl_min_interval = 0
+    return config
+
+
+def main(args):
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="bench_crawl_"))
+    os.makedirs(workdir, exist_ok=True)
+    server = make_server(args)
+    cache_server = server.start()
+    config = make_config(
+        args, cache_server, server.site.seed_urls(), workdir)
+    # Logs/ and the report files are written to the working directory.
+    os.chdir(workdir)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    crawl(config, server, True)
+    if args.recrawl:
+        server.site.generation = getattr(server.site, "generation", 0) + 1
+        server.requests.clear()
+        config.recrawl = True
+        print()
+        crawl(config, server, False)
+    server.stop()
+    print(f"workdir      {workdir}")
+
+
+def crawl(config, server, restart):
+    crawler_class = AsyncCrawler if config.engine == "async" else Crawler
+    crawler = crawler_class(config, restart)
+    io_before = read_io()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    crawler.start()
+    elapsed = time.perf_counter() - start
+    if config.parse_processes:
+        # Reaps the parse processes, so their CPU time is counted.
+        get_parse_pool(config).shutdown()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_after = read_io()
+
+    pages = sum(server.requests.values())
+    cpu = (usage.ru_utime - usage_before.ru_utime
+           + usage.ru_stime - usage_before.ru_stime)
+    children_cpu = children.ru_utime + children.ru_stime
+    Report.merge()
+    print(f"engine {config.engine}, {config.threads_count} threads, "
+          f"{config.parse_processes} parse processes, store {config.save_store}, "
+          f"politeness {config.time_delay}s")
+    print(f"pages        {pages} in {elapsed:.2f}s, {pages / elapsed:,.1f} pages/sec")
+    print(f"cpu          {cpu:.2f}s ({cpu / elapsed:.0%} of one core), "
+          f"parse processes {children_cpu:.2f}s")
+    print(f"peak rss     {usage.ru_maxrss / 1024:.1f} MB, "
+          f"parse processes {children.ru_maxrss / 1024:.1f} MB")
+    syncs = metrics.histograms.get("frontier_sync")
+    if syncs is not None:
+        _, count, total = syncs.snapshot()
+        print(f"frontier     {count} syncs, {total:.2f}s syncing, "
+              f"{files_size(config.save_file) / 1024:.0f} KB on disk")
+    if io_before and io_after:
+        print(f"disk i/o     {(io_after[0] - io_before[0]) / 1024:.0f} KB read, "
+              f"{(io_after[1] - io_before[1]) / 1024:.0f} KB written")
+    print(f"cache        {dict(sorted(server.requests.items()))} by status, "
+          f"{getattr(server.site, 'trap_pages', 0)} trap pages, "
+          f"{download_stats.summary()}")
+    print(f"report       {len(Report.unique_pages)} unique pages, "
+          f"{len(Report.subdomains)} subdomains, longest {Report.longestPage}")
+    visits = {
+        labels[0][1]: value for (name, labels), value in metrics.counters.items()
+        if name == "page_visits"}
+    if visits:
+        print(f"visits       {visits}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=["threads", "async"], default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--parse_processes", type=int, default=None)
+    parser.add_argument("--store", choices=["sqlite", "shelve"], default=None)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--archive", type=str, default=None,
+                        help="record the responses in this archive")
+    parser.add_argument("--workdir", type=str, default=None)
+    parser.add_argument("--verbose", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False,
+                        help="crawl again incrementally after pages changed")
+    args = parser.parse_args()
+    args.config_file = os.path.abspath(args.config_file)
+    main(args)
@@ -0,0 +1,77 @@
+''' Benchmark of the parse stage: pages/sec when scraping in threads versus
+in a ParsePool with a growing number of processes.
+
+    python -m benchmarks.bench_parse_pool --pages 400 --processes 1 2 4
+
+The parse processes are configured from config.ini (or --config_file), with
+only the number of processes changed.
+'''
+import time
+import random
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import scraper
+from crawler.parse_pool import ParsePool
+from utils.config import Config
+
+
+def synthetic_page(i, size, rng):
+    words = ["research", "student", "data", "the", "graduate", "software", "ics", "computing"]
+    paragraphs = list()
+    length = 0
+    while length < size:
+        text = " ".join(rng.choice(words) for _ in range(60))
+        href = f"https://www.ics.uci.edu/page/{rng.randrange(100000)}"
+        paragraph = f"<p>{text} <a href='{href}'>more</a></p>"
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    body = "".join(paragraphs)
+    content = f"<html><head><title>{i}</title></head><body>{body}</body></html>"
+    raw = SimpleNamespace(
+        content=content.encode("utf-8"),
+        headers={"Content-Type": "text/html; charset=utf-8"})
+    return SimpleNamespace(
+        url=f"https://www.ics.uci.edu/page/{i}", status=200, raw_response=raw)
+
+
+def run(scrape, pages, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda resp: scrape(resp.url, resp), pages))
+    return len(pages) / (time.perf_counter() - start)
+
+
+def main(count, size, process_counts, threads, config_file):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    scraper.configure(config)
+    rng = random.Random(0)
+    pages = [synthetic_page(i, size, rng) for i in range(count)]
+    print(f"{count} pages of ~{size // 1024} KB, {threads} fetch threads")
+    rate = run(scraper.scraper, pages, threads)
+    print(f"in threads        {rate:>8,.1f} pages/sec")
+    for processes in process_counts:
+        config.parse_processes = processes
+        pool = ParsePool(config)
+        # Start the processes before timing.
+        run(pool.scrape, pages[:processes * 2], processes * 2)
+        rate = run(pool.scrape, pages, threads)
+        pool.shutdown()
+        print(f"{processes:>2} processes     {rate:>8,.1f} pages/sec")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--page_kb", type=int, default=100)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    args = parser.parse_args()
+    main(args.pages, args.page_kb * 1024, args.processes, args.threads,
+         args.config_file)
@@ -0,0 +1,59 @@
+''' Microbenchmark of the frontier save file backends.
+
+Replays the write pattern of a crawl (a contains check and a put for every
+discovered url, then a put for every completed url) and reports URLs/sec.
+The cases that commit every url only replay the first sync_urls urls, since
+they take a disk sync each.
+
+    python -m benchmarks.bench_store --urls 20000 --sync_urls 1000
+'''
+import os
+import time
+import tempfile
+
+from argparse import ArgumentParser
+
+from crawler.store import ShelveStore, SQLiteStore
+from utils import get_urlhash
+
+
+def run(store_class, path, urls, commit_every, commit_interval):
+    store = store_class(path, commit_every, commit_interval)
+    start = time.perf_counter()
+    for url in urls:
+        urlhash = get_urlhash(url)
+        if urlhash not in store:
+            store.put(urlhash, url, False)
+    for url in urls:
+        store.put(get_urlhash(url), url, True)
+    store.close()
+    return len(urls) / (time.perf_counter() - start)
+
+
+def main(count, sync_count, commit_every, commit_interval):
+    urls = [f"https://www.ics.uci.edu/page/{i}" for i in range(count)]
+    sync_urls = urls[:sync_count]
+    cases = [
+        ("shelve, sync per url", ShelveStore, sync_urls, 1, 0.0),
+        ("shelve, group commit", ShelveStore, urls, commit_every, commit_interval),
+        ("sqlite, commit per url", SQLiteStore, sync_urls, 1, 0.0),
+        ("sqlite, group commit", SQLiteStore, urls, commit_every, commit_interval),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, store_class, case_urls, every, interval) in enumerate(cases):
+            path = os.path.join(tmp, f"bench{i}")
+            rate = run(store_class, path, case_urls, every, interval)
+            print(f"{name:<24} {rate:>12,.0f} urls/sec "
+                  f"({len(case_urls)} urls)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--sync_urls", type=int, default=1000,
+                        help="urls replayed by the commit per url cases")
+    parser.add_argument("--commit_every", type=int, default=256)
+    parser.add_argument("--commit_interval_ms", type=float, default=1000)
+    args = parser.parse_args()
+    main(args.urls, args.sync_urls, args.commit_every,
+         args.commit_interval_ms / 1000)
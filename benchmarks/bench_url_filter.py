@@ -0,0 +1,108 @@
+''' Benchmark of the url filter in scraper.py.
+
+Compares the compiled URLFilter against the previous per-link path (a
+urlparse and a regex compile per rule for every link) on a corpus of hrefs,
+checks that both make the same decisions, and reports links/sec.
+
+    python -m benchmarks.bench_url_filter --corpus hrefs.txt
+
+The corpus holds one absolute url per line. Without one, a synthetic corpus
+covering every rule is generated.
+'''
+import re
+import time
+import random
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+
+import scraper
+
+
+def legacy_accepts(url):
+    # The filter as it was before URLFilter: every rule parses the url again
+    # and compiles its regexes on every call.
+    parsed = urlparse(url)
+    if parsed.scheme not in set(scraper.ALLOWED_SCHEMES):
+        return False
+    parsed_url = urlparse(url)
+    if not any(parsed_url.netloc.lower().endswith(domain)
+               for domain in list(scraper.ALLOWED_DOMAINS)):
+        return False
+    if re.match(scraper.IGNORED_EXTENSIONS, parsed.path.lower()):
+        return False
+    parsed_url = urlparse(url)
+    for pattern in list(scraper.IGNORED_PATHS):
+        if re.search(pattern, parsed_url.path):
+            return False
+    parsed_url = urlparse(url)
+    ignored_keys = set(scraper.IGNORED_QUERY_KEYS)
+    for key in parse_qs(parsed_url.query).keys():
+        if key in ignored_keys:
+            return False
+    parsed_url = urlparse(url)
+    for regex in [re.compile(p) for p in scraper.TRAP_PATTERNS]:
+        if regex.search(parsed_url.path):
+            return False
+    return True
+
+
+def synthetic_corpus(count, seed=0):
+    rng = random.Random(seed)
+    hosts = [
+        "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+        "www.stat.uci.edu", "gitlab.ics.uci.edu", "wics.ics.uci.edu",
+        "www.google.com", "uci.edu"]
+    paths = [
+        "/", "/about", "/~eppstein/pix/a/b.html", "/events/2024-05-01",
+        "/community/news/view_news", "/-/tree/main", "/files/paper.pdf",
+        "/~dechter/r123.html", "/faculty/profiles/view_faculty.php",
+        "/research/areas", "/courses/cs121/index.html", "/img/logo.png"]
+    queries = ["", "", "", "id=4", "ical=1", "share=twitter", "page=2&sort=a"]
+    corpus = []
+    for _ in range(count):
+        scheme = rng.choice(["https", "https", "http", "mailto"])
+        query = rng.choice(queries)
+        corpus.append(
+            f"{scheme}://{rng.choice(hosts)}{rng.choice(paths)}"
+            + (f"?{query}" if query else ""))
+    return corpus
+
+
+def rate(accepts, corpus):
+    start = time.perf_counter()
+    for url in corpus:
+        accepts(url)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main(corpus_file, count):
+    if corpus_file:
+        with open(corpus_file, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus(count)
+
+    mismatches = [
+        url for url in corpus
+        if legacy_accepts(url) != scraper.url_filter.accepts(url)]
+    print(f"{len(corpus)} links, {len(mismatches)} decisions differ")
+    for url in mismatches[:10]:
+        print(f"  {url}")
+
+    before = rate(legacy_accepts, corpus)
+    after = rate(scraper.url_filter.accepts, corpus)
+    print(f"before     {before:>12,.0f} links/sec")
+    print(f"URLFilter  {after:>12,.0f} links/sec ({after / before:.1f}x)")
+    print("rejections by rule:")
+    for rule, rejected in scraper.url_filter.rejected.most_common():
+        print(f"  {rule:<10} {rejected}")
+    print(scraper.url_filter.host_cache_info())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--links", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.corpus, args.links)
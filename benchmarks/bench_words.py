@@ -0,0 +1,161 @@
+''' Benchmark of the report's text statistics: words/sec of Report.get_words
+plus Report.count_words against the previous per-word generator path, on the
+text of a corpus of saved pages. Also checks that both produce the same
+counts, in the same order, so REPORT.txt does not change, and that the
+streaming parse of scraper.parse_page gives the same links and text as the
+tree parse on every page.
+
+    python -m benchmarks.bench_words --corpus saved_pages/
+
+The corpus is a directory of saved pages (any files, parsed as html).
+Without one, a synthetic corpus is generated.
+'''
+import os
+import re
+import time
+import random
+
+from argparse import ArgumentParser
+from collections import Counter
+from types import SimpleNamespace
+
+import scraper
+from report import Report
+
+
+def legacy_get_words(texts):
+    # The word path as it was before: a generator per text block and a
+    # regex match plus a stop-word lookup per word.
+    for text in texts:
+        text = text.strip()
+        if text:
+            for word in text.split():
+                yield word.lower()
+
+
+def legacy_count_words(words_iter):
+    word_counts = Counter()
+    count = 0
+    pattern = re.compile(r"^[A-Za-z']+$")
+    for word in words_iter:
+        if word in Report.stop_words:
+            continue
+        elif not pattern.match(word):
+            continue
+        else:
+            word_counts[word] += 1
+            count += 1
+    return word_counts, count
+
+
+def legacy(texts):
+    words = list(legacy_get_words(texts))
+    return words, legacy_count_words(words)
+
+
+def current(texts):
+    words = Report.get_words(texts)
+    return words, Report.count_words(words)
+
+
+def synthetic_corpus(count, seed=0):
+    rng = random.Random(seed)
+    words = [
+        "Research", "the", "student's", "data", "AND", "graduate", "don't",
+        "x86", "ICS", "computing", "café", "e-mail", "it's", "Irvine,",
+        "2024", "'quoted'", "software", "of", "UCI", "machine", "learning"]
+    corpus = list()
+    for _ in range(count):
+        blocks = list()
+        for _ in range(rng.randint(5, 60)):
+            blocks.append("\n  ".join(
+                " ".join(rng.choice(words) for _ in range(rng.randint(0, 20)))
+                for _ in range(rng.randint(1, 3))))
+        corpus.append(blocks)
+    return corpus
+
+
+# Pages on which the two parse paths are easy to tell apart.
+EDGE_PAGES = [
+    b"<html><body>a<p>b<b>c</b>d<script>x</script>e</p>f<!-- g -->h</body></html>",
+    b"<html><head><title>t</title></head><p>no body tag</p></html>",
+    b"<p>a fragment</p><p>without a head</p>",
+    b"<title>t</title><p>a fragment with a head</p>",
+    b"<html><head><title>t</title></head></html>",
+    b'<?xml version="1.0" encoding="utf-8"?><html><body><a href="/x">x</a></body></html>',
+    '<html><head><meta charset="iso-8859-1"></head><body>caf\xe9 '
+    '<a href="/caf\xe9">x</a></body></html>'.encode("latin-1"),
+    b"<html><body>bad \xff\xfe utf-8 <pre>code</pre>tail</body></html>",
+]
+
+
+def load_pages(directory):
+    pages = list()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as f:
+            pages.append((name, f.read()))
+    return pages
+
+
+def parse(name, content, streaming):
+    raw = SimpleNamespace(content=content, headers={"Content-Type": "text/html"})
+    resp = SimpleNamespace(
+        url=f"https://www.ics.uci.edu/{name}", status=200, raw_response=raw)
+    scraper.streaming_parse_bytes = 1 if streaming else 0
+    try:
+        return scraper.parse_page(resp)
+    finally:
+        scraper.streaming_parse_bytes = 0
+
+
+def compare_parsers(pages):
+    mismatches = 0
+    for name, content in pages:
+        tree = parse(name, content, False)
+        stream = parse(name, content, True)
+        if (list(tree.hrefs), list(tree.texts)) != (list(stream.hrefs), list(stream.texts)):
+            mismatches += 1
+            print(f"parse paths differ on {name}")
+    print(f"{len(pages)} pages, {mismatches} pages parse differently when streamed")
+
+
+def rate(count, corpus, words):
+    start = time.perf_counter()
+    for texts in corpus:
+        count(texts)
+    return words / (time.perf_counter() - start)
+
+
+def main(corpus_dir, count):
+    pages = [(f"edge{i}", page) for i, page in enumerate(EDGE_PAGES)]
+    if corpus_dir:
+        pages = load_pages(corpus_dir)
+    compare_parsers(pages)
+    if corpus_dir:
+        corpus = [list(parse(name, content, False).texts) for name, content in pages]
+    else:
+        corpus = synthetic_corpus(count)
+
+    mismatches = 0
+    words = 0
+    for texts in corpus:
+        before = legacy(texts)
+        after = current(texts)
+        words += len(before[0])
+        # Counters compare equal regardless of order, most_common does not.
+        if before != after or list(before[1][0]) != list(after[1][0]):
+            mismatches += 1
+    print(f"{len(corpus)} pages, {words} words, {mismatches} pages differ")
+
+    before = rate(legacy, corpus, words)
+    after = rate(current, corpus, words)
+    print(f"before      {before:>12,.0f} words/sec")
+    print(f"count_words {after:>12,.0f} words/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--pages", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.corpus, args.pages)
@@ -0,0 +1,279 @@
+''' Local stand-in for the spacetime cache server, for offline benchmarks.
+
+Answers the same GET /?q=<url>&u=<user agent> requests as the cache server,
+with a CBOR map of url, status and a pickled requests.Response, which is
+what utils/response.Response expects. Pages come from a synthetic site
+graph, or from a recorded one. Every answer can be delayed, and a share of
+them can fail with a transient 503 of the cache server itself.
+
+    python -m benchmarks.fake_cache --port 9000 --pages 5000 --latency_ms 20
+
+The synthetic graph spreads pages over a few uci.edu hosts. Pages link to
+other pages, to anchors, to files and to other domains, a share of them are
+exact copies of another page, and www.ics.uci.edu has an endless calendar
+(every day has the same text and links to the next one) as a trap. With --robots, every host has a
+robots.txt that disallows the calendar and points to a sitemap of the host's
+pages. Raising generation changes the content of change_rate of the pages.
+
+A recorded graph is a JSON lines file of {"url", "status", "content_type",
+"body"} objects, one per page.
+'''
+import json
+import time
+import pickle
+import random
+import threading
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+from requests.structures import CaseInsensitiveDict
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "sdcl.ics.uci.edu"]
+TRAP_HOST = "www.ics.uci.edu"
+VOCABULARY = (
+    "research student data computing software graduate faculty course "
+    "learning machine systems security network theory algorithm design "
+    "university irvine science informatics statistics project lab seminar "
+    "paper award program undergraduate vision human interaction database").split()
+
+
+class SyntheticSite(object):
+    ''' A deterministic site graph of pages pages. Page i always has the same
+    words and links for the same seed. '''
+
+    def __init__(self, pages=2000, links=12, words=400, duplicate_rate=0.05,
+                 trap=True, seed=0, robots=False, change_rate=0.1):
+        self.pages = pages
+        self.links = links
+        self.words = words
+        self.duplicate_rate = duplicate_rate
+        self.trap = trap
+        self.seed = seed
+        self.robots = robots
+        self.change_rate = change_rate
+        self.generation = 0
+        # Calendar pages served, the cost of the trap.
+        self.trap_pages = 0
+
+    def seed_urls(self):
+        return [f"https://{host}/page/{i}" for i, host in enumerate(HOSTS)]
+
+    def _url(self, i):
+        return f"https://{HOSTS[i % len(HOSTS)]}/page/{i}"
+
+    def get(self, url):
+        ''' (status, content type, body) of url. '''
+        parsed = urlparse(url)
+        parts = parsed.path.strip("/").split("/")
+        if self.robots and parsed.path == "/robots.txt":
+            return 200, "text/plain", (
+                f"User-agent: *\nDisallow: /calendar/\n"
+                f"Sitemap: https://{parsed.hostname}/sitemap.xml\n").encode("utf-8")
+        if self.robots and parsed.path == "/sitemap.xml":
+            return 200, "application/xml", self._sitemap(parsed.hostname)
+        if (self.trap and parsed.hostname == TRAP_HOST
+                and len(parts) == 2 and parts[0] == "calendar"):
+            return self._calendar(parts[1])
+        if len(parts) != 2 or parts[0] != "page" or not parts[1].isdigit():
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+        i = int(parts[1])
+        if i >= self.pages or url.split("#")[0] != self._url(i):
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+        return 200, "text/html; charset=utf-8", self._page(i)
+
+    def _page(self, i):
+        version = ""
+        if self.generation and random.Random(
+                f"{self.seed}/{i}/{self.generation}").random() < self.change_rate:
+            version = f"/{self.generation}"
+        rng = random.Random(f"{self.seed}/{i}{version}")
+        if rng.random() < self.duplicate_rate:
+            # Same words as another page.
+            rng = random.Random(f"{self.seed}/{rng.randrange(self.pages)}")
+        # Half of the words are common to every page, the other half come
+        # from the page's own topic, so that pages are not near duplicates.
+        topic = [f"term{rng.randrange(5000)}" for _ in range(40)]
+        words = " ".join(
+            rng.choice(topic) if rng.random() < 0.5 else rng.choice(VOCABULARY)
+            for _ in range(self.words))
+        links = list()
+        for _ in range(self.links):
+            kind = rng.random()
+            target = self._url(rng.randrange(self.pages))
+            if kind < 0.1:
+                target += f"#section{rng.randrange(5)}"
+            elif kind < 0.15:
+                target = f"/files/paper{rng.randrange(100)}.pdf"
+            elif kind < 0.2:
+                target = f"https://www.example.com/{rng.randrange(100)}"
+            elif kind < 0.22 and self.trap:
+                target = f"https://{TRAP_HOST}/calendar/{rng.randrange(20000)}"
+            links.append(f"<li><a href='{target}'>link</a></li>")
+        return (
+            f"<html><head><title>Page {i}</title><script>var x = {i};</script>"
+            f"</head><body><h1>Page {i}</h1><p>{words}</p><ul>{''.join(links)}"
+            f"</ul></body></html>").encode("utf-8")
+
+    def _sitemap(self, host):
+        locs = "".join(
+            f"<url><loc>{self._url(i)}</loc><lastmod>2024-01-{i % 28 + 1:02d}</lastmod></url>"
+            for i in range(self.pages) if HOSTS[i % len(HOSTS)] == host)
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns='
+            f'"http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'
+        ).encode("utf-8")
+
+    def _calendar(self, day):
+        if not day.isdigit():
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+        day = int(day)
+        self.trap_pages += 1
+        # The same navigation text on every day, as on a real calendar.
+        body = (
+            f"<html><body><h1>Events of day {day}</h1><p>No events.</p>"
+            f"<p>{' '.join(VOCABULARY * 2)}</p>"
+            f"<a href='/calendar/{day - 1}'>previous</a>"
+            f"<a href='/calendar/{day + 1}'>next</a></body></html>")
+        return 200, "text/html; charset=utf-8", body.encode("utf-8")
+
+
+class RecordedSite(object):
+    ''' A site graph read from a JSON lines file, see the module docstring. '''
+
+    def __init__(self, path):
+        self.responses = dict()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    page = json.loads(line)
+                    self.responses[page["url"]] = (
+                        page.get("status", 200),
+                        page.get("content_type", "text/html"),
+                        page["body"].encode("utf-8"))
+        self.first_url = next(iter(self.responses), None)
+
+    def seed_urls(self):
+        return [self.first_url] if self.first_url else []
+
+    def get(self, url):
+        return self.responses.get(
+            url, (404, "text/html", b"<html><body>Not found</body></html>"))
+
+
+class FakeCacheServer(ThreadingHTTPServer):
+    ''' Serves site on 127.0.0.1. requests counts the answers per page
+    status, and the transient errors of the cache server as 503. '''
+    daemon_threads = True
+    # The async engine opens up to MAX_IN_FLIGHT connections at once, more
+    # than the default backlog of 5 lets through.
+    request_queue_size = 256
+
+    def __init__(self, site, port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 seed=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = dict()
+
+    def start(self):
+        ''' Serves in a background thread. Returns (host, port), the value of
+        config.cache_server. '''
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def answer(self, url):
+        ''' (HTTP status of the cache server, body) for a request of url. '''
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            failed = self.rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self.count(503)
+            return 503, b""
+        status, content_type, body = self.site.get(url)
+        self.count(status)
+        raw = requests.models.Response()
+        raw._content = body
+        raw.status_code = status
+        raw.url = url
+        raw.headers = CaseInsensitiveDict({"Content-Type": content_type})
+        return 200, cbor.dumps({
+            "url": url, "status": status, "response": pickle.dumps(raw)})
+
+    def count(self, status):
+        with self.lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real cache server.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        status, body = self.server.answer(url)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_site(args):
+    if args.site:
+        return RecordedSite(args.site)
+    return SyntheticSite(
+        args.pages, args.links, args.words, args.duplicate_rate,
+        not args.no_trap, args.seed, args.robots, args.change_rate)
+
+
+def add_arguments(parser):
+    parser.add_argument("--site", type=str, default=None,
+                        help="recorded site graph (JSON lines)")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=12)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--duplicate_rate", type=float, default=0.05)
+    parser.add_argument("--no_trap", action="store_true", default=False)
+    parser.add_argument("--robots", action="store_true", default=False,
+                        help="serve robots.txt and sitemaps")
+    parser.add_argument("--change_rate", type=float, default=0.1,
+                        help="share of pages that change between crawls")
+    parser.add_argument("--latency_ms", type=float, default=10)
+    parser.add_argument("--jitter_ms", type=float, default=0)
+    parser.add_argument("--error_rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def make_server(args, port=0):
+    return FakeCacheServer(
+        make_site(args), port, args.latency_ms / 1000, args.jitter_ms / 1000,
+        args.error_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(args, args.port)
+    print(f"Serving on {server.server_address}, seeds: {' '.join(make_site(args).seed_urls())}")
+    server.serve_forever()
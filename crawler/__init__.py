@@ -1,12 +1,25 @@
+import signal
+import threading
+
 from utils import get_logger
+from utils.log import configure_logging, flush_logs
+from utils.download import stats as download_stats
+from utils.metrics import metrics
+from utils.canonical import canonicalizer
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+import scraper
+from report import Report
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        configure_logging(config)
         self.logger = get_logger("CRAWLER")
+        scraper.configure(config)
         self.frontier = frontier_factory(config, restart)
+        metrics.add_gauge("frontier_queue_depth", "host", self.frontier.queue_depths)
+        metrics.add_gauge("canonical_cache", "result", canonicalizer.stats)
         self.workers = list()
         self.worker_factory = worker_factory
 
@@ -14,13 +27,52 @@ class Crawler(object):
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
+        metrics.start(self.logger)
         for worker in self.workers:
             worker.start()
 
     def start(self):
-        self.start_async()
-        self.join()
+        previous = self._catch_interrupt()
+        try:
+            self.start_async()
+            self.join()
+        finally:
+            metrics.stop()
+            if previous is not None:
+                signal.signal(signal.SIGINT, previous)
 
     def join(self):
         for worker in self.workers:
             worker.join()
+        self._finish()
+
+    def _catch_interrupt(self):
+        # The first SIGINT stops the crawl after the urls in flight, so the
+        # frontier and the report are saved; a second one quits at once.
+        # Returns the previous handler, or None off the main thread.
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        return signal.signal(signal.SIGINT, self._interrupt)
+
+    def _interrupt(self, signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.logger.info(
+            "Interrupted, finishing the urls in flight. "
+            "Interrupt again to quit now.")
+        # The main thread may be holding the frontier lock.
+        threading.Thread(target=self.frontier.stop, daemon=True).start()
+
+    def _finish(self):
+        # Runs once, after every worker stopped.
+        if self.frontier.stopping:
+            self.logger.info("Crawl interrupted. Stopping Crawler.")
+        else:
+            self.logger.info("Frontier is empty. Stopping Crawler.")
+        self.logger.info(f"Download stats: {download_stats.summary()}")
+        self.logger.info(f"Metrics: {metrics.summary()}")
+        self.frontier.flush()
+        metrics.write_stats_to_file()
+        Report.write_report_to_file()
+        scraper.duplicate_detector.write_stats_to_file()
+        scraper.trap_detector.write_stats_to_file()
+        flush_logs()
@@ -0,0 +1,214 @@
+import os
+import re
+import gzip
+import time
+import struct
+import zlib
+
+from threading import Lock
+
+from requests.structures import CaseInsensitiveDict
+
+from utils import get_urlhash
+from utils.response import Response
+from crawler.seen import DIGEST_SIZE, get_digest
+
+_archive = None
+_archive_lock = Lock()
+
+
+def get_archive(config):
+    ''' The process-wide ResponseArchive of config.archive, or None if
+    recording is off. '''
+    global _archive
+    if not config.archive:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = ResponseArchive(config.archive, config.archive_segment_bytes)
+        return _archive
+
+
+class ResponseArchive(object):
+    ''' Append-only archive of downloaded responses, in the spirit of WARC.
+
+    Responses are appended to numbered segment files, each record its own
+    gzip member, so a record can be read on its own given its offset. A new
+    segment is started once the current one holds segment_bytes. The index
+    file maps the digest of a url's urlhash to the (segment, offset, length)
+    of its latest record, in fixed size entries appended after the record
+    is written. A record torn by a crash is not in the index. '''
+    MAGIC = b"CRAWL-ARCHIVE/1.0"
+    INDEX_ENTRY = struct.Struct(f"<{DIGEST_SIZE}sIQI")
+    SEGMENT_NAME = re.compile(r"^segment-(\d+)\.gz$")
+
+    def __init__(self, directory, segment_bytes=64 << 20):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index")
+        # digest -> (segment, offset, length)
+        self.index = dict()
+        self._load_index()
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 0
+        self.segment_file = None
+        self.index_file = None
+
+    def _segment_path(self, segment):
+        return segment_path(self.directory, segment)
+
+    def segments(self):
+        ''' Numbers of the segment files, in order. '''
+        return sorted(
+            int(match.group(1)) for match in map(
+                self.SEGMENT_NAME.match, os.listdir(self.directory)) if match)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        size = self.INDEX_ENTRY.size
+        # A trailing partial entry was torn by a crash.
+        for start in range(0, len(data) - size + 1, size):
+            digest, segment, offset, length = self.INDEX_ENTRY.unpack_from(data, start)
+            self.index[digest] = (segment, offset, length)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, url):
+        return get_digest(get_urlhash(url)) in self.index
+
+    def append(self, url, resp, content=True):
+        ''' Records resp, the response downloaded for url. Without content
+        only its status and size are recorded, for responses skipped on
+        their size, which are then not unpickled. '''
+        record = gzip.compress(_encode(url, resp, content), compresslevel=6)
+        digest = get_digest(get_urlhash(url))
+        with self.lock:
+            if self.segment_file is None:
+                self.segment_file = open(self._segment_path(self.segment), "ab")
+                self.index_file = open(self.index_path, "ab")
+            offset = self.segment_file.tell()
+            if offset and offset + len(record) > self.segment_bytes:
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(self._segment_path(self.segment), "ab")
+                offset = 0
+            self.segment_file.write(record)
+            self.segment_file.flush()
+            self.index_file.write(self.INDEX_ENTRY.pack(
+                digest, self.segment, offset, len(record)))
+            self.index_file.flush()
+            self.index[digest] = (self.segment, offset, len(record))
+
+    def get(self, url):
+        ''' (url, Response) recorded for url, or None. '''
+        with self.lock:
+            location = self.index.get(get_digest(get_urlhash(url)))
+            if self.segment_file is not None:
+                self.segment_file.flush()
+        if location is None:
+            return None
+        segment, offset, length = location
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return _decode(zlib.decompress(f.read(length), 31))
+
+    def locations(self):
+        ''' {segment: [(offset, length), ...]} of the latest record of every
+        url, in file order. '''
+        with self.lock:
+            entries = sorted(self.index.values())
+        locations = dict()
+        for segment, offset, length in entries:
+            locations.setdefault(segment, list()).append((offset, length))
+        return locations
+
+    def read_segment(self, segment, locations):
+        ''' Yields the (url, Response) records at locations of a segment. '''
+        return read_records(self._segment_path(segment), locations)
+
+    def close(self):
+        with self.lock:
+            for f in (self.segment_file, self.index_file):
+                if f is not None:
+                    f.close()
+            self.segment_file = self.index_file = None
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"segment-{segment:05d}.gz")
+
+
+def read_records(path, locations):
+    ''' Yields the (url, Response) records at locations of a segment file,
+    without loading the index. '''
+    with open(path, "rb") as f:
+        for offset, length in locations:
+            f.seek(offset)
+            yield _decode(zlib.decompress(f.read(length), 31))
+
+
+def _encode(url, resp, with_content=True):
+    # Record header lines, then the stored response's headers and content.
+    raw = resp.raw_response if with_content else None
+    fields = [
+        ("Target-URL", url),
+        ("Response-URL", resp.url),
+        ("Status", "" if resp.status is None else str(resp.status)),
+        ("Date", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))]
+    if resp.error:
+        fields.append(("Error", resp.error))
+    if not with_content:
+        fields.append(("Size", str(resp.size)))
+    block = b""
+    if raw is not None:
+        headers = getattr(raw, "headers", None) or dict()
+        content = getattr(raw, "content", None) or b""
+        block = "".join(
+            f"{key}: {_one_line(value)}\r\n" for key, value in headers.items()
+        ).encode("utf-8") + b"\r\n" + content
+        fields.append(("Raw-Response", "1"))
+    fields.append(("Content-Length", str(len(block))))
+    head = b"\r\n".join(
+        [ResponseArchive.MAGIC]
+        + [f"{key}: {_one_line(value)}".encode("utf-8") for key, value in fields])
+    return head + b"\r\n\r\n" + block
+
+
+def _one_line(value):
+    return str(value).replace("\r", " ").replace("\n", " ")
+
+
+def _decode(data):
+    head, _, block = data.partition(b"\r\n\r\n")
+    lines = head.decode("utf-8").split("\r\n")
+    fields = dict(line.split(": ", 1) for line in lines[1:])
+    resp = Response({
+        "url": fields["Response-URL"],
+        "status": int(fields["Status"]) if fields["Status"] else None,
+        "error": fields.get("Error")})
+    if "Size" in fields:
+        resp.size = int(fields["Size"])
+    if "Raw-Response" in fields:
+        # Header lines, each ending in CRLF, then a CRLF before the content.
+        lines = list()
+        while not block.startswith(b"\r\n"):
+            line, _, block = block.partition(b"\r\n")
+            lines.append(line.decode("utf-8").split(": ", 1))
+        content = block[2:]
+        headers = CaseInsensitiveDict(lines)
+        resp.raw_response = _RawResponse(fields["Response-URL"], content, headers)
+    return fields["Target-URL"], resp
+
+
+class _RawResponse(object):
+    # The parts of requests.Response that the scraper reads.
+    def __init__(self, url, content, headers):
+        self.url = url
+        self.content = content
+        self.headers = headers
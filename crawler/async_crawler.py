@@ -0,0 +1,150 @@
+import signal
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.parse_pool import get_parse_pool
+from crawler.archive import get_archive
+from crawler.worker import is_crawl_error
+from utils import get_logger
+from utils.log import log_event
+from utils.metrics import metrics
+from utils.download import AsyncCacheClient, download_async
+import scraper
+
+
+class AsyncCrawler(Crawler):
+    ''' Crawls with asyncio pipelines instead of one thread per download.
+
+    Up to config.max_in_flight downloads wait on the cache server at once,
+    over non-blocking keep-alive connections. The frontier still decides
+    when each host may be fetched from. Nothing that takes the frontier's
+    lock or touches the disk runs on the event loop: frontier polls run on a
+    thread of their own, and robots.txt checks, scraper.scraper and the
+    frontier updates on a thread pool of config.threads_count threads (with
+    parsing itself in the ParsePool if configured). '''
+
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        super().__init__(config, restart, frontier_factory)
+        self.worker_logger = get_logger("Worker-async", "Worker")
+        self.parse_pool = get_parse_pool(config) if config.parse_processes else None
+        self.archive = get_archive(config)
+        self.thread = None
+
+    def start_async(self):
+        self.thread = Thread(target=self.start, daemon=True)
+        self.thread.start()
+
+    def start(self):
+        previous = self._catch_interrupt()
+        try:
+            metrics.start(self.logger)
+            asyncio.run(self._crawl())
+        finally:
+            metrics.stop()
+            if previous is not None:
+                signal.signal(signal.SIGINT, previous)
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    async def _crawl(self):
+        self.client = AsyncCacheClient(self.config)
+        # Number of pipelines between taking a url and marking it complete.
+        self.active = 0
+        self.wakeup = asyncio.Event()
+        # Polls only hold the frontier's lock briefly, so they get a thread
+        # of their own rather than queue behind parsing.
+        try:
+            with ThreadPoolExecutor(max_workers=self.config.threads_count) as executor, \
+                    ThreadPoolExecutor(max_workers=1) as poller:
+                self.executor = executor
+                self.poller = poller
+                await asyncio.gather(*(
+                    self._pipeline() for _ in range(self.config.max_in_flight)))
+        finally:
+            # The report and the frontier are saved even if a pipeline failed.
+            await self.client.close()
+            self._finish()
+
+    async def _pipeline(self):
+        loop = asyncio.get_running_loop()
+        start = metrics.clock()
+        while True:
+            tbd_url, wait = await loop.run_in_executor(
+                self.poller, self.frontier.poll_tbd_url)
+            if tbd_url is None:
+                if wait is None and not self.active:
+                    # Nothing pending and nothing that could add more.
+                    self.wakeup.set()
+                    return
+                # Wait for a host to become ready, or for new urls.
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            metrics.observe("politeness_wait", start)
+            self.active += 1
+            try:
+                allowed = True
+                if scraper.robots is not None:
+                    # Downloads robots.txt the first time a host is seen or
+                    # once it expires, and takes the frontier's lock anyway.
+                    allowed = await loop.run_in_executor(
+                        self.executor, self.frontier.check_robots, tbd_url,
+                        self.worker_logger)
+                if not allowed:
+                    self.worker_logger.info(
+                        f"Skipped {tbd_url}, disallowed by robots.txt.")
+                    log_event("robots_disallowed", url=tbd_url)
+                    continue
+                resp = await download_async(
+                    tbd_url, self.config, self.client, self.worker_logger)
+                self.worker_logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+                await loop.run_in_executor(
+                    self.executor, self._process, tbd_url, resp)
+            except Exception as e:
+                if is_crawl_error(e):
+                    # Other pipelines finish their urls and stop. tbd_url
+                    # stays in flight, so the checkpoint keeps it pending.
+                    self.worker_logger.exception(
+                        f"Failed to crawl {tbd_url}, stopping the crawl.")
+                    await loop.run_in_executor(self.executor, self.frontier.stop)
+                    return
+                # Only this url failed, it must not stay in flight.
+                self.worker_logger.exception(f"Failed to crawl {tbd_url}.")
+                await loop.run_in_executor(
+                    self.executor, self.frontier.mark_url_complete, tbd_url)
+            finally:
+                self.active -= 1
+                self.wakeup.set()
+                start = metrics.clock()
+
+    def _process(self, tbd_url, resp):
+        # Responses the scraper skips on their size are not unpickled for the
+        # archive or the page history either.
+        content, _, _, reason, _ = scraper.gate_response(resp)
+        if self.archive is not None:
+            self.archive.append(tbd_url, resp, reason != "too_large")
+        changed = self.frontier.record_visit(tbd_url, resp, content)
+        if not changed:
+            # Unchanged since the last crawl, nothing new to scrape.
+            scraped_urls = list()
+        elif self.parse_pool:
+            scraped_urls = self.parse_pool.scrape(tbd_url, resp)
+        else:
+            scraped_urls = scraper.scraper(tbd_url, resp)
+        log_event(
+            "fetch", url=tbd_url, status=resp.status, bytes=resp.size,
+            links=len(scraped_urls), changed=changed)
+        for scraped_url in scraped_urls:
+            self.frontier.add_url(scraped_url)
+        self.frontier.mark_url_complete(tbd_url)
@@ -0,0 +1,180 @@
+import os
+import pickle
+import itertools
+
+from utils import get_urlhash
+from crawler.seen import get_digest
+
+
+class Checkpoint(object):
+    ''' Compact snapshot of the frontier's pending urls, seen-url index and
+    report, plus a delta log of the urls added and completed since the
+    snapshot, and a snapshot of the robots.txt cache and of the duplicate
+    and trap detectors taken at the same time.
+
+    Resuming from it costs time proportional to the pending work instead of
+    a scan of the whole save file. Pending urls spilled to disk are recorded
+    by segment name. Urls completed after the snapshot are not in its
+    report, so they stay pending and are crawled again.
+
+    A checkpoint is taken in two steps, so that the frontier only holds its
+    lock while it copies its state: start begins the delta log of a new
+    generation, and write then saves the snapshot of that generation. Delta
+    logs alternate between two files and start with the generation they
+    apply to. A resume applies the log of the snapshot's generation, and the
+    next one if a later snapshot was started but never written. '''
+    ADD = "A"
+    COMPLETE = "C"
+
+    def __init__(self, save_file):
+        self.path = f"{save_file}.ckpt"
+        self.delta_paths = (f"{save_file}.delta", f"{save_file}.delta1")
+        self.robots_path = f"{save_file}.robots"
+        self.detectors_path = f"{save_file}.detectors"
+        self.generation = 0
+        self.delta = None
+        # Records of a log whose snapshot was started but not written before
+        # a crash, see load and start.
+        self.unwritten = list()
+        # (report state, generation) of the snapshot read by load.
+        self.report = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def remove(self):
+        self.close()
+        for path in (
+                self.path, *self.delta_paths, self.robots_path,
+                self.detectors_path, f"{self.path}.tmp",
+                f"{self.robots_path}.tmp", f"{self.detectors_path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self, seen_index):
+        ''' Returns (pending urls, seen index, {host: [(segment, count)]}),
+        or None if there is no usable checkpoint for this seen index type.
+        Urls completed after the snapshot are pending. '''
+        state = self._load(self.path)
+        if state is None:
+            return None
+        self.report = (state["report"], state["generation"])
+        if state["seen_index"] != seen_index:
+            return None
+        self.generation = state["generation"]
+        pending = dict.fromkeys(state["pending"])
+        seen = state["seen"]
+        self.unwritten = list(self._read_delta(self.generation + 1))
+        delta = itertools.chain(self._read_delta(self.generation), self.unwritten)
+        for op, url in delta:
+            if op == self.ADD:
+                pending[url] = None
+                seen.add(get_digest(get_urlhash(url)))
+        return list(pending), seen, state["spilled"]
+
+    def _delta_path(self, generation):
+        return self.delta_paths[generation % 2]
+
+    def _read_delta(self, generation):
+        try:
+            f = open(self._delta_path(generation), "rb")
+        except OSError:
+            return
+        with f:
+            try:
+                if pickle.load(f) != generation:
+                    return
+                while True:
+                    yield pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                # End of log, or a record torn by a crash.
+                return
+
+    def load_report(self):
+        ''' Returns (report state, urls completed since) of the last write,
+        or None. The pages of those urls are not in the report. '''
+        if self.report is None:
+            state = self._load(self.path)
+            if state is None:
+                return None
+            self.report = (state["report"], state["generation"])
+        report_state, generation = self.report
+        self.report = None
+        delta = itertools.chain(
+            self._read_delta(generation), self._read_delta(generation + 1))
+        completed = dict.fromkeys(
+            url for op, url in delta if op == self.COMPLETE)
+        return report_state, list(completed)
+
+    def load_robots(self):
+        ''' Returns the robots.txt cache state saved by the last write, or
+        None. '''
+        return self._load(self.robots_path)
+
+    def load_detectors(self):
+        ''' Returns the (duplicate detector, trap detector) states saved by
+        the last write, or None. '''
+        return self._load(self.detectors_path)
+
+    def _load(self, path):
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def start(self):
+        ''' Starts the delta log of a new generation and returns it. Urls
+        logged from now on are not part of its snapshot. The snapshot of
+        the previous generation must have been written. '''
+        self.generation += 1
+        self.close()
+        self.delta = open(self._delta_path(self.generation), "wb")
+        self._append(self.generation)
+        # Records that load resumed from the log being replaced are kept
+        # until the snapshot of this generation is written.
+        for record in self.unwritten:
+            self._append(record)
+        self.unwritten = list()
+        return self.generation
+
+    def write(self, generation, pending, seen, seen_index, report_state,
+              spilled=None, robots_state=None, detectors_state=None):
+        ''' Atomically replaces the snapshots with those of generation, as
+        the frontier and the report were when start returned it. '''
+        if robots_state is not None:
+            self._replace(self.robots_path, robots_state)
+        if detectors_state is not None:
+            self._replace(self.detectors_path, detectors_state)
+        self._replace(self.path, {
+            "generation": generation,
+            "seen_index": seen_index,
+            "pending": list(pending),
+            "seen": seen,
+            "spilled": spilled or dict(),
+            "report": report_state})
+
+    def _replace(self, path, state):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def log_add(self, url):
+        self._append((self.ADD, url))
+
+    def log_complete(self, url):
+        self._append((self.COMPLETE, url))
+
+    def _append(self, record):
+        if self.delta is None:
+            self.delta = open(self._delta_path(self.generation), "ab")
+        pickle.dump(record, self.delta, protocol=pickle.HIGHEST_PROTOCOL)
+        self.delta.flush()
+
+    def close(self):
+        if self.delta is not None:
+            self.delta.close()
+            self.delta = None
@@ -1,72 +1,485 @@
-import os
-import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
-from queue import Queue, Empty
+from threading import RLock, Condition
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urlhash
+from utils.canonical import canonicalize
+from utils.metrics import metrics
+from crawler.store import get_store_class, open_store
+from crawler.seen import get_digest, make_seen_index, measure_lookup_rate
+from crawler.checkpoint import Checkpoint
+from crawler.spill import SpillStore, HostQueue
+from crawler.history import PageHistory
 from scraper import is_valid
+import scraper
+from report import Report
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
+        self.lock = RLock()
+        self.ready = Condition(self.lock)
+        # Per-host scheduling state. Every host with pending urls and no url
+        # in flight has exactly one (next_allowed_time, host) entry in the
+        # heap, so the head of the heap is always the host that may be
+        # fetched from the soonest. A host with a url in flight is busy and
+        # goes back on the heap when that url is completed, politeness delay
+        # counted from then.
+        self.host_queues = dict()
+        self.host_heap = list()
+        self.host_next_fetch = dict()
+        self.busy_hosts = set()
+        # Host queues keep at most config.pending_memory bytes of urls in
+        # memory and spill the rest to segment files.
+        self.spill = SpillStore(
+            f"{self.config.save_file}.spill", self.config.pending_memory,
+            self.config.pending_segment_urls, self.config.pending_mmap)
+        # In-memory index of every urlhash in the save file, so that only
+        # urls that are really new reach the disk.
+        self.seen = make_seen_index(self.config)
+
+        store_class = get_store_class(self.config)
+        self.checkpoint = Checkpoint(self.config.save_file)
+        # Urls handed to a worker but not marked complete yet.
+        self.in_flight = set()
+        self.completed_since_checkpoint = 0
+        # Set by stop: no more urls are handed out.
+        self.stopping = False
+        # Set while a checkpoint is written outside the lock.
+        self.checkpointing = False
+        if not store_class.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif store_class.exists(self.config.save_file) and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            store_class.remove(self.config.save_file)
+        history_path = f"{self.config.save_file}.pages"
+        if not store_class.exists(self.config.save_file):
+            # A checkpoint and a page history are only valid together with
+            # their save file.
+            self.checkpoint.remove()
+            PageHistory.remove(history_path)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = open_store(self.config)
+        self.history = None
+        if self.config.page_history:
+            self.history = PageHistory(
+                history_path, self.config.recrawl_interval,
+                self.config.recrawl_min_interval,
+                self.config.recrawl_max_interval, self.config.commit_every)
+        Report.history = self.history
+        # Pages are counted when their url is completed, so that checkpoints
+        # of the report and of the frontier agree.
+        Report.hold_pages = True
+        from_checkpoint = False
         if restart:
+            self.spill.clear()
             for url in self.config.seed_urls:
                 self.add_url(url)
-        else:
+        elif self.config.revalidate or not self._load_checkpoint():
             # Set the frontier state with contents of save file.
+            self.spill.clear()
             self._parse_save_file()
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        else:
+            from_checkpoint = True
+        if not restart:
+            self._load_report(requeue=not from_checkpoint)
+            self._load_robots()
+            self._load_detectors()
+            if self.config.recrawl:
+                self._schedule_revisits()
+        self._checkpoint()
+        self._log_seen_index()
+
+    def _load_checkpoint(self):
+        state = self.checkpoint.load(self.config.seen_index)
+        if state is None:
+            return False
+        pending, self.seen, spilled = state
+        with self.lock:
+            self.spill.keep_only(
+                {name for segments in spilled.values() for name, _ in segments})
+            for url in pending:
+                self._enqueue(url)
+            for host, segments in spilled.items():
+                for name, count in segments:
+                    self._host_queue(host).add_segment(name, count)
+        self.logger.info(
+            f"Found {len(pending) + self.spill.on_disk} urls to be downloaded "
+            f"in checkpoint {self.checkpoint.path} ({self.spill.on_disk} "
+            f"spilled to disk), {len(self.seen)} urls discovered.")
+        return True
+
+    def _load_report(self, requeue):
+        # Urls completed after the checkpoint are crawled again, their pages
+        # are not in its report. They are pending already if the frontier
+        # was loaded from the checkpoint too.
+        loaded = self.checkpoint.load_report()
+        if loaded is None:
+            return
+        state, completed = loaded
+        Report.set_state(state)
+        with self.lock:
+            for url in completed:
+                self.save.put(get_urlhash(url), url, False)
+                if requeue:
+                    self._enqueue(url)
+        self.logger.info(
+            f"Resuming report from {self.checkpoint.path}, "
+            f"{len(Report.unique_pages)} unique pages counted, "
+            f"{len(completed)} pages completed since to crawl again.")
+
+    def _load_robots(self):
+        state = self.checkpoint.load_robots()
+        if state is None or scraper.robots is None:
+            return
+        scraper.robots.set_state(state)
+        self.logger.info(
+            f"Loaded robots.txt rules of {len(state)} hosts from "
+            f"{self.checkpoint.robots_path}.")
+
+    def _load_detectors(self):
+        state = self.checkpoint.load_detectors()
+        if state is None:
+            return
+        duplicates, traps = state
+        scraper.duplicate_detector.set_state(duplicates)
+        scraper.trap_detector.set_state(traps)
+        self.logger.info(
+            f"Loaded {len(scraper.duplicate_detector.exact)} page fingerprints "
+            f"and {len(scraper.trap_detector.blocked)} cut off url templates "
+            f"from {self.checkpoint.detectors_path}.")
+
+    def _schedule_revisits(self):
+        # Completed pages whose revisit is due are pending again.
+        if self.history is None:
+            self.logger.error("Recrawl needs PAGE_HISTORY = true.")
+            return
+        count = 0
+        with self.lock:
+            for url in self.history.due():
+                urlhash = get_urlhash(url)
+                entry = self.save.get(urlhash)
+                if entry is None or not entry[1]:
+                    # Already pending.
+                    continue
+                self.checkpoint.log_add(url)
+                self.save.put(urlhash, url, False)
+                self._enqueue(url)
+                count += 1
+        self.logger.info(
+            f"Recrawl: {count} of {len(self.history)} pages are due for a "
+            f"revisit.")
+
+    def record_visit(self, url, resp, content):
+        ''' Records the downloaded page, whose gated content is content, in
+        the page history. Returns False if it did not change since the last
+        visit, so its links and words are already in the frontier and the
+        report. '''
+        if self.history is None:
+            return True
+        result = self.history.record(url, resp, content)
+        if result is not None:
+            metrics.count("page_visits", result=result)
+        return result != "unchanged"
+
+    def _checkpoint(self):
+        # Caller must not hold self.lock. Waits for a checkpoint that is
+        # being written, then writes one.
+        with self.lock:
+            while self.checkpointing:
+                self.ready.wait()
+            snapshot = self._start_checkpoint()
+        self._write_checkpoint(snapshot)
+
+    def _start_checkpoint(self):
+        # Caller must hold self.lock. Copies the state to checkpoint, for
+        # _write_checkpoint to save once the lock is released. None if a
+        # checkpoint is being written already.
+        # Spilled urls are saved as the names of their segments, which are
+        # kept on disk until the next checkpoint no longer needs them.
+        if self.checkpointing:
+            return None
+        self.checkpointing = True
+        pending = list(self.in_flight)
+        spilled = dict()
+        for host, queue in self.host_queues.items():
+            pending.extend(queue.in_memory())
+            if queue.segments:
+                spilled[host] = list(queue.segments)
+        self.completed_since_checkpoint = 0
+        return (
+            self.checkpoint.start(), pending, self.seen.copy(), spilled,
+            Report.get_state(), self.spill.take_retired())
+
+    def _write_checkpoint(self, snapshot):
+        # Caller must not hold self.lock: pickling and syncing the snapshot
+        # does not stop the workers. The report was copied along with the
+        # frontier, so it holds exactly the pages of the completed urls.
+        if snapshot is None:
+            return
+        generation, pending, seen, spilled, report_state, retired = snapshot
+        try:
+            robots_state = None
+            if scraper.robots is not None:
+                robots_state = scraper.robots.get_state()
+            detectors_state = (
+                scraper.duplicate_detector.get_state(),
+                scraper.trap_detector.get_state())
+            self.checkpoint.write(
+                generation, pending, seen, self.config.seen_index,
+                report_state, spilled, robots_state,
+                detectors_state)
+            self.spill.purge(retired)
+            if self.history is not None:
+                self.history.commit()
+        finally:
+            with self.lock:
+                self.checkpointing = False
+                self.ready.notify_all()
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
+        total_count = 0
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        self.loaded_digests = list()
+        with self.lock:
+            for urlhash, (url, completed) in self.save.items():
+                digest = get_digest(urlhash)
+                self.seen.add(digest)
+                if total_count < 5000:
+                    self.loaded_digests.append(digest)
+                total_count += 1
+                if not completed and is_valid(url):
+                    self._enqueue(url)
+                    tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _log_seen_index(self):
+        count = len(self.seen)
+        rate = measure_lookup_rate(
+            self.seen, getattr(self, "loaded_digests", []))
+        self.logger.info(
+            f"Seen url index ({type(self.seen).__name__}): {count} urls in "
+            f"{self.seen.nbytes} bytes "
+            f"({self.seen.nbytes / max(count, 1):.1f} bytes/url), "
+            f"{rate:,.0f} lookups/sec.")
+
+    @staticmethod
+    def _get_host(url):
+        return (urlparse(url).hostname or "").lower()
+
+    def _host_queue(self, host):
+        # Caller must hold self.lock.
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = HostQueue(self.spill)
+            if host not in self.busy_hosts:
+                # Host was idle: schedule it no earlier than politeness allows.
+                heapq.heappush(
+                    self.host_heap,
+                    (self.host_next_fetch.get(host, 0.0), host))
+                self.ready.notify()
+        return queue
+
+    def _enqueue(self, url):
+        # Caller must hold self.lock.
+        self._host_queue(self._get_host(url)).append(url)
+        if self.spill.over_budget():
+            self._spill()
+
+    def _spill(self):
+        # Caller must hold self.lock. Spills the newest urls of the longest
+        # queues until a quarter of the budget is free again, so every host
+        # keeps the urls it will be fetched from next in memory.
+        target = self.spill.memory_budget * 3 // 4
+        queues = sorted(
+            self.host_queues.values(), key=lambda queue: len(queue.tail),
+            reverse=True)
+        spilled = 0
+        for queue in queues:
+            if self.spill.memory <= target or not queue.tail:
+                break
+            spilled += queue.spill()
+        metrics.count("frontier_spilled_urls", spilled)
+        # Heads read back from disk are not spilled again. If they alone are
+        # over the budget, wait for another quarter of it before retrying.
+        self.spill.floor = (
+            self.spill.memory + self.spill.memory_budget // 4
+            if self.spill.memory > target else 0)
+
+    def _popleft(self, queue):
+        # Caller must hold self.lock. None if every url left was dropped.
+        # Urls of templates whose pages turned out to have no new content
+        # since they were queued are dropped.
+        while queue:
+            url = queue.popleft()
+            if url is None:
+                # Its last segments were missing on disk.
+                return None
+            if scraper.trap_detector.is_unproductive(url):
+                metrics.count("frontier_urls", result="trap_dropped")
+                continue
+            return url
+        return None
+
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        ''' Blocks until some host may be fetched from politely, and returns
+        the next url of that host. While nothing is pending but urls are
+        still in flight, waits for their links. Returns None once nothing
+        is pending or in flight, or after stop. '''
+        start = metrics.clock()
+        with self.lock:
+            while True:
+                url, wait = self.poll_tbd_url()
+                if url is not None:
+                    metrics.observe("politeness_wait", start)
+                    return url
+                if wait is None and (self.stopping or not self.in_flight):
+                    return None
+                # Woken early if a host that is ready sooner is added, and by
+                # mark_url_complete once the last url in flight is done.
+                self.ready.wait(wait)
+
+    def poll_tbd_url(self):
+        ''' Non-blocking get_tbd_url. Returns (url, None) if some host may be
+        fetched from now, (None, seconds until one may) if all hosts with
+        pending urls are waiting on politeness, and (None, None) if nothing
+        is pending (or after stop). '''
+        with self.lock:
+            if self.stopping:
+                return None, None
+            if not self.host_heap:
+                # The final state is saved by flush once the workers stop.
+                return None, None
+            next_fetch, host = self.host_heap[0]
+            now = time.monotonic()
+            if next_fetch > now:
+                return None, next_fetch - now
+            heapq.heappop(self.host_heap)
+            queue = self.host_queues[host]
+            url = self._popleft(queue)
+            if url is None:
+                del self.host_queues[host]
+                return self.poll_tbd_url()
+            if not queue:
+                del self.host_queues[host]
+            # Off the heap until url is completed, see mark_url_complete.
+            self.busy_hosts.add(host)
+            self.in_flight.add(url)
+            return url, None
+
+    def _host_delay(self, host):
+        # Politeness, or the host's robots.txt crawl-delay if longer.
+        delay = self.config.time_delay
+        if scraper.robots is not None:
+            delay = max(delay, scraper.robots.crawl_delay(host) or 0)
+        return delay
+
+    def check_robots(self, url, logger=None):
+        ''' Called by workers before url is downloaded. Reads the robots.txt
+        of url's host if needed, and adds the urls of its sitemaps. Returns
+        False, with url marked complete, if robots.txt disallows it. '''
+        if scraper.robots is None:
+            return True
+        allowed, sitemap_urls = scraper.robots.check(url, logger)
+        added = 0
+        for sitemap_url in sitemap_urls:
+            if scraper.is_valid(sitemap_url):
+                self.add_url(sitemap_url)
+                added += 1
+        if sitemap_urls:
+            self.logger.info(
+                f"Found {len(sitemap_urls)} urls in the sitemaps of "
+                f"{self._get_host(url)}, {added} of them valid.")
+        if not allowed:
+            metrics.count("robots_disallowed")
+            self.mark_url_complete(url)
+        return allowed
 
     def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
+        start = metrics.clock()
+        canonical = canonicalize(url)
+        urlhash = get_urlhash(canonical)
+        digest = get_digest(urlhash)
+        with self.lock:
+            # A bloom filter hit may be a false positive, confirm it on disk.
+            if digest in self.seen and (
+                    self.seen.exact or urlhash in self.save):
+                metrics.count("frontier_urls", result="seen")
+            elif not scraper.trap_detector.admit(canonical):
+                metrics.count("frontier_urls", result="trap")
+            else:
+                self.seen.add(digest)
+                self.checkpoint.log_add(canonical)
+                self.save.put(urlhash, canonical, False)
+                self._enqueue(canonical)
+                metrics.count("frontier_urls", result="added")
+        metrics.observe("frontier_add", start)
+
+    def queue_depths(self):
+        ''' Number of pending urls per host. '''
+        with self.lock:
+            return {host: len(queue) for host, queue in self.host_queues.items()}
+
     def mark_url_complete(self, url):
+        start = metrics.clock()
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        snapshot = None
+        with self.lock:
+            if get_digest(urlhash) not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            if url in self.in_flight:
+                self.in_flight.remove(url)
+                self._release_host(self._get_host(url))
+            if not self.in_flight:
+                self.ready.notify_all()
+            Report.complete(url)
+            self.checkpoint.log_complete(url)
+            self.save.put(urlhash, url, True)
+            self.completed_since_checkpoint += 1
+            if self.completed_since_checkpoint >= self.config.checkpoint_every:
+                snapshot = self._start_checkpoint()
+        self._write_checkpoint(snapshot)
+        metrics.observe("frontier_complete", start)
+
+    def _release_host(self, host):
+        # Caller must hold self.lock. The host's url is done, it may be
+        # fetched from again once its politeness delay has passed.
+        self.busy_hosts.discard(host)
+        next_fetch = time.monotonic() + self._host_delay(host)
+        self.host_next_fetch[host] = next_fetch
+        queue = self.host_queues.get(host)
+        if queue is None:
+            return
+        if queue:
+            heapq.heappush(self.host_heap, (next_fetch, host))
+            self.ready.notify()
+        else:
+            del self.host_queues[host]
+
+    def stop(self):
+        ''' Stops handing out urls. Workers finish the urls they have. '''
+        with self.lock:
+            self.stopping = True
+            self.ready.notify_all()
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def flush(self):
+        ''' Checkpoints the frontier and the report at the end of a crawl. '''
+        self._checkpoint()
+        self.save.commit()
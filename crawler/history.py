@@ -0,0 +1,156 @@
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+
+from hashlib import blake2b
+from threading import RLock
+
+from utils import get_urlhash
+
+
+class PageHistory(object):
+    ''' What every downloaded page looked like, for incremental recrawls.
+
+    For each url it keeps a hash of the content, the ETag and Last-Modified
+    headers if the response had them, and how often the page was checked
+    and found changed, plus one row per visit in the changes table. The
+    words table keeps the word counts the report got from each page, so
+    that a page that changed replaces them rather than adds to them. The
+    revisit interval of a page starts at interval seconds, is halved every
+    time the page changed and doubled every time it did not, within
+    [min_interval, max_interval]. due lists the pages whose next visit has
+    come.
+
+    A SQLite file next to the save file, committed every commit_every
+    visits and whenever the frontier writes a checkpoint. '''
+
+    def __init__(self, path, interval, min_interval, max_interval, commit_every=1):
+        self.path = path
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.commit_every = max(1, commit_every)
+        self.lock = RLock()
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "content_hash BLOB, etag TEXT, last_modified TEXT, "
+            "last_visit REAL NOT NULL, last_change REAL NOT NULL, "
+            "next_visit REAL NOT NULL, interval REAL NOT NULL, "
+            "checks INTEGER NOT NULL, changes INTEGER NOT NULL) WITHOUT ROWID")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS pages_next_visit ON pages (next_visit)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "urlhash TEXT NOT NULL, visited REAL NOT NULL, "
+            "changed INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS words ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "counts BLOB NOT NULL, total INTEGER NOT NULL) WITHOUT ROWID")
+        self.conn.commit()
+
+    @classmethod
+    def remove(cls, path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def record(self, url, resp, content):
+        ''' Records a visit of url. content is what scraper.gate_response
+        let through, so skipped responses are never read. Returns "new" for
+        a page never recorded before, "changed" or "unchanged", or None if
+        there is no content. '''
+        if resp.status != 200 or content is None:
+            return None
+        headers = getattr(resp.raw_response, "headers", None) or dict()
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        content_hash = blake2b(content, digest_size=16).digest()
+        urlhash = get_urlhash(url)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content_hash, last_change, interval, checks, changes "
+                "FROM pages WHERE urlhash = ?", (urlhash,)).fetchone()
+            if row is None:
+                result = "new"
+                interval, checks, changes, last_change = self.interval, 0, 0, now
+            else:
+                previous_hash, last_change, interval, checks, changes = row
+                if previous_hash == content_hash:
+                    result = "unchanged"
+                    interval = min(interval * 2, self.max_interval)
+                else:
+                    result = "changed"
+                    interval = max(interval / 2, self.min_interval)
+                    changes += 1
+                    last_change = now
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (urlhash, url, content_hash, "
+                "etag, last_modified, last_visit, last_change, next_visit, "
+                "interval, checks, changes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (urlhash, url, content_hash, etag, last_modified, now,
+                 last_change, now + interval, interval, checks + 1, changes))
+            self.conn.execute(
+                "INSERT INTO changes (urlhash, visited, changed) VALUES (?, ?, ?)",
+                (urlhash, now, int(result != "unchanged")))
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.commit()
+        return result
+
+    def replace_words(self, url, page_url, word_counts, total):
+        ''' Keeps the word counts of the page downloaded for url, served from
+        page_url, and returns the ones kept before as (word counts, total),
+        or None for a page not counted before. Keyed by url, as the visits
+        are. '''
+        urlhash = get_urlhash(url)
+        counts = zlib.compress(pickle.dumps(dict(word_counts)))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT counts, total FROM words WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO words (urlhash, url, counts, total) "
+                "VALUES (?, ?, ?, ?)", (urlhash, page_url, counts, total))
+        if row is None:
+            return None
+        return pickle.loads(zlib.decompress(row[0])), row[1]
+
+    def longest_page(self):
+        ''' (page url, total) of the page with the most words, or None. '''
+        with self.lock:
+            return self.conn.execute(
+                "SELECT url, total FROM words ORDER BY total DESC "
+                "LIMIT 1").fetchone()
+
+    def due(self, now=None):
+        ''' Urls whose next visit is at or before now, most overdue first. '''
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url FROM pages WHERE next_visit <= ? "
+                "ORDER BY next_visit", (now or time.time(),)).fetchall()
+        return [url for url, in rows]
+
+    def commit(self):
+        with self.lock:
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
@@ -0,0 +1,89 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from threading import Lock
+from types import SimpleNamespace
+
+import scraper
+
+# Bodies at least this large are handed to the parse processes through shared
+# memory instead of being pickled through the pool's pipe.
+SHARED_MEMORY_MIN_BYTES = 1 << 16
+
+_pool = None
+_pool_lock = Lock()
+
+
+def get_parse_pool(config):
+    ''' The process-wide ParsePool, created on first use. '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool(config)
+        return _pool
+
+
+class ParsePool(object):
+    ''' Runs the CPU-bound half of the scraper (lxml parsing, word counting,
+    link filtering, fingerprinting) in config.parse_processes processes, away
+    from the GIL. The results are merged into the report, the duplicate and
+    trap detectors and the frontier by the calling thread. '''
+
+    def __init__(self, config):
+        # Spawned rather than forked, since the crawler's threads may hold
+        # locks at the time a process is started.
+        self.executor = ProcessPoolExecutor(
+            max_workers=config.parse_processes, mp_context=get_context("spawn"),
+            initializer=scraper.configure, initargs=(config,))
+
+    def scrape(self, url, resp):
+        ''' Same result as scraper.scraper(url, resp). '''
+        return scraper.apply_analysis(url, resp.url, self.analyze(resp))
+
+    def analyze(self, resp):
+        content, _, _, reason, skipped_bytes = scraper.gate_response(resp)
+        if content is None:
+            # Nothing to parse, not worth a trip to a process.
+            return scraper.analyze_page(resp)
+        raw = resp.raw_response
+        headers = {
+            key: raw.headers.get(key, "")
+            for key in ("Content-Type", "Content-Disposition")}
+        analysis = self._submit(resp, headers, content)
+        if reason is not None:
+            # Only the truncated content was sent.
+            analysis.gated = reason
+            analysis.skipped_bytes = skipped_bytes
+        return analysis
+
+    def _submit(self, resp, headers, content):
+        if len(content) < SHARED_MEMORY_MIN_BYTES:
+            return self.executor.submit(
+                _analyze, resp.url, resp.status, headers, content,
+                None, 0).result()
+
+        shm = shared_memory.SharedMemory(create=True, size=len(content))
+        try:
+            shm.buf[:len(content)] = content
+            return self.executor.submit(
+                _analyze, resp.url, resp.status, headers, None,
+                shm.name, len(content)).result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _analyze(url, status, headers, content, shm_name, size):
+    # Runs in a parse process.
+    if shm_name is not None:
+        # The parent owns the block and unlinks it once this returns.
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            content = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+    raw = SimpleNamespace(content=content, headers=headers)
+    resp = SimpleNamespace(url=url, status=status, raw_response=raw)
+    return scraper.analyze_page(resp)
@@ -0,0 +1,63 @@
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from crawler.archive import ResponseArchive, read_records, segment_path
+from utils import get_logger
+from utils.log import configure_logging, flush_logs
+import scraper
+from report import Report
+
+
+def replay(config):
+    ''' Runs the scraper and the report over every response recorded in
+    config.archive instead of downloading them, and writes the report files.
+    The frontier is not touched.
+
+    With config.parse_processes, segments are parsed in that many processes
+    and their results are merged in segment order, so the report is the
+    same as a replay in a single process. '''
+    configure_logging(config)
+    logger = get_logger("REPLAY")
+    scraper.configure(config)
+    archive = ResponseArchive(config.archive, config.archive_segment_bytes)
+    locations = archive.locations()
+    logger.info(
+        f"Replaying {len(archive)} responses in {len(locations)} segments "
+        f"of {config.archive}.")
+    pages = links = 0
+    start = time.perf_counter()
+    if config.parse_processes:
+        with ProcessPoolExecutor(
+                max_workers=config.parse_processes,
+                mp_context=get_context("spawn"),
+                initializer=scraper.configure, initargs=(config,)) as executor:
+            results = executor.map(
+                _analyze_segment,
+                [config.archive] * len(locations),
+                list(locations.keys()), list(locations.values()))
+            for analyses in results:
+                for url, resp_url, analysis in analyses:
+                    pages += 1
+                    links += len(scraper.apply_analysis(url, resp_url, analysis))
+    else:
+        for segment, segment_locations in locations.items():
+            for url, resp in archive.read_segment(segment, segment_locations):
+                pages += 1
+                links += len(scraper.scraper(url, resp))
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Replayed {pages} pages in {elapsed:.1f}s "
+        f"({pages / max(elapsed, 1e-9):,.0f} pages/sec), {links} links found.")
+    Report.write_report_to_file()
+    scraper.duplicate_detector.write_stats_to_file()
+    scraper.trap_detector.write_stats_to_file()
+    flush_logs()
+
+
+def _analyze_segment(directory, segment, locations):
+    # Runs in a replay process.
+    return [
+        (url, resp.url, scraper.analyze_page(resp))
+        for url, resp in read_records(segment_path(directory, segment), locations)]
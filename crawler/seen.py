@@ -0,0 +1,151 @@
+import os
+import math
+import time
+
+
+DIGEST_SIZE = 16
+
+
+def get_digest(urlhash):
+    ''' Fixed width binary form of a urlhash (sha256 hexdigest). '''
+    return bytes.fromhex(urlhash[:DIGEST_SIZE * 2])
+
+
+class DigestSet(object):
+    ''' Exact set of url digests in one flat bytearray.
+
+    Open addressing with linear probing over DIGEST_SIZE byte slots, so a url
+    costs DIGEST_SIZE / load factor bytes instead of a str object plus a set
+    entry. An all-zero slot is empty. '''
+    exact = True
+    max_load = 0.6
+
+    def __init__(self, capacity=1024):
+        slots = 1
+        while slots * self.max_load < capacity:
+            slots <<= 1
+        self._allocate(slots)
+
+    def _allocate(self, slots):
+        self.slots = slots
+        self.mask = slots - 1
+        self.table = bytearray(slots * DIGEST_SIZE)
+        self.view = memoryview(self.table)
+        self.count = 0
+
+    def _find(self, digest):
+        # Index of the slot holding digest, or of the empty slot ending its
+        # probe sequence.
+        view = self.view
+        i = int.from_bytes(digest[:8], "little") & self.mask
+        while True:
+            start = i * DIGEST_SIZE
+            slot = view[start:start + DIGEST_SIZE]
+            if slot == digest or not any(slot):
+                return start
+            i = (i + 1) & self.mask
+
+    def __contains__(self, digest):
+        start = self._find(digest)
+        return self.view[start:start + DIGEST_SIZE] == digest
+
+    def add(self, digest):
+        start = self._find(digest)
+        if self.view[start:start + DIGEST_SIZE] == digest:
+            return
+        self.table[start:start + DIGEST_SIZE] = digest
+        self.count += 1
+        if self.count > self.slots * self.max_load:
+            self._grow()
+
+    def _grow(self):
+        old = self.view
+        self._allocate(self.slots * 2)
+        for start in range(0, len(old), DIGEST_SIZE):
+            slot = old[start:start + DIGEST_SIZE]
+            if any(slot):
+                self.add(bytes(slot))
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # memoryviews cannot be pickled, the table is enough to rebuild it.
+        return {"table": self.table, "count": self.count}
+
+    def __setstate__(self, state):
+        self.table = state["table"]
+        self.view = memoryview(self.table)
+        self.slots = len(self.table) // DIGEST_SIZE
+        self.mask = self.slots - 1
+        self.count = state["count"]
+
+    def copy(self):
+        copy = DigestSet.__new__(DigestSet)
+        copy.__setstate__({"table": bytearray(self.table), "count": self.count})
+        return copy
+
+    @property
+    def nbytes(self):
+        return len(self.table)
+
+
+class BloomFilter(object):
+    ''' Probabilistic set of url digests sized for capacity urls at the given
+    false positive rate. A miss is certain, a hit has to be confirmed against
+    the save file. '''
+    exact = False
+
+    def __init__(self, capacity, fp_rate):
+        self.size = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        # Double hashing (Kirsch-Mitzenmacher) from the two halves of digest.
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+    def add(self, digest):
+        bits = self.bits
+        for p in self._positions(digest):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def copy(self):
+        copy = BloomFilter.__new__(BloomFilter)
+        copy.__dict__.update(self.__dict__, bits=bytearray(self.bits))
+        return copy
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+
+def make_seen_index(config):
+    if config.seen_index == "hashset":
+        return DigestSet()
+    elif config.seen_index == "bloom":
+        return BloomFilter(config.bloom_capacity, config.bloom_fp_rate)
+    raise ValueError(
+        f"Unknown SEEN_INDEX {config.seen_index!r}, "
+        f"expected hashset or bloom.")
+
+
+def measure_lookup_rate(index, known, samples=10000):
+    ''' Lookups per second over a mix of known digests and random misses. '''
+    probes = list(known[:samples // 2])
+    probes += [os.urandom(DIGEST_SIZE) for _ in range(samples - len(probes))]
+    start = time.perf_counter()
+    for digest in probes:
+        digest in index
+    return len(probes) / max(time.perf_counter() - start, 1e-9)
@@ -0,0 +1,248 @@
+import os
+import time
+import bisect
+import signal
+
+from functools import partial
+from hashlib import blake2b
+from multiprocessing import get_context
+from queue import Empty
+from threading import Thread
+from urllib.parse import urlparse
+
+from crawler.frontier import Frontier
+from utils import get_logger
+from report import Report
+
+
+class HashRing(object):
+    ''' Consistent hashing of hosts onto shards. Every shard has replicas
+    points on the ring and a host belongs to the first point after its hash,
+    so adding a shard only moves the hosts that land on its points. '''
+
+    def __init__(self, shards, replicas=64):
+        points = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, host):
+        i = bisect.bisect(self.hashes, _hash(host)) % len(self.hashes)
+        return self.shards[i]
+
+
+def _hash(key):
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class ShardedFrontier(Frontier):
+    ''' The frontier of one shard of a sharded crawl.
+
+    Only urls of the hosts that the ring assigns to this shard are added
+    here, so the shard owns their save file entries and politeness. Urls of
+    other shards' hosts are buffered and forwarded to their inbox in batches
+    of config.shard_batch, or every config.shard_flush_interval seconds.
+    A receiver thread adds the batches that arrive in this shard's inbox.
+
+    When nothing is pending or in flight, the shard reports itself idle and
+    keeps waiting for forwarded urls, until the coordinator sees that every
+    shard is idle with no batch in transit and sets done. After a stop the
+    outboxes are still forwarded, and the receiver keeps adding urls to the
+    save file until every shard has finished. '''
+
+    def __init__(self, config, restart, shard, ring, inboxes, state):
+        self.shard = shard
+        self.ring = ring
+        self.inboxes = inboxes
+        self.state = state
+        self.outboxes = {i: list() for i in range(len(inboxes)) if i != shard}
+        self.last_flush = time.monotonic()
+        # Every shard is given every seed, and keeps only its own.
+        self.forwarding = False
+        super().__init__(config, restart)
+        self.forwarding = True
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def add_url(self, url):
+        shard = self.ring.shard_for((urlparse(url).hostname or "").lower())
+        if shard == self.shard:
+            return super().add_url(url)
+        if not self.forwarding:
+            return
+        with self.lock:
+            outbox = self.outboxes[shard]
+            outbox.append(url)
+            if len(outbox) >= self.config.shard_batch:
+                self._send(shard)
+
+    def _send(self, shard):
+        # Caller must hold self.lock.
+        batch = self.outboxes[shard]
+        self.outboxes[shard] = list()
+        with self.state.sent.get_lock():
+            self.state.sent[self.shard] += len(batch)
+        self.inboxes[shard].put(batch)
+
+    def _flush(self):
+        # Caller must hold self.lock.
+        for shard, outbox in self.outboxes.items():
+            if outbox:
+                self._send(shard)
+        self.last_flush = time.monotonic()
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard]
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            with self.lock:
+                # Marked busy before the urls stop counting as in transit,
+                # so the coordinator cannot miss them.
+                self.state.idle[self.shard] = 0
+                for url in batch:
+                    Frontier.add_url(self, url)
+                with self.state.received.get_lock():
+                    self.state.received[self.shard] += len(batch)
+                self.ready.notify_all()
+
+    def poll_tbd_url(self):
+        with self.lock:
+            if self.stopping:
+                # Links of the pages completed since the last flush.
+                self._flush()
+                return None, None
+            if time.monotonic() - self.last_flush >= self.config.shard_flush_interval:
+                self._flush()
+            url, wait = super().poll_tbd_url()
+            if url is not None or wait is not None:
+                self.state.idle[self.shard] = 0
+                return url, wait
+            if self.in_flight:
+                # Pages being scraped may still add urls.
+                return None, self.config.shard_flush_interval
+            self._flush()
+            self.state.idle[self.shard] = 1
+            if self.state.done.is_set():
+                return None, None
+            return None, self.config.shard_flush_interval
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+        super().flush()
+
+    def stop_receiver(self):
+        ''' Waits until the coordinator stops the receiver, once every shard
+        has finished, and saves the urls received after flush. '''
+        self.receiver.join()
+        self.save.commit()
+
+
+class _ShardState(object):
+    # Shared between the coordinator and the shard processes.
+    def __init__(self, context, shards):
+        self.sent = context.Array("q", shards)
+        self.received = context.Array("q", shards)
+        self.idle = context.Array("b", shards, lock=False)
+        self.done = context.Event()
+
+
+def run_sharded(config, restart):
+    ''' Crawls with config.shards processes, each with its own frontier for
+    the hosts assigned to it, and writes the merged report.
+
+    Shard i works in the directory shards/<i>, with its own save file and
+    Logs/ (and its own archive, if recording). Logs/REPORT.txt is the report
+    of all shards. Duplicate pages are only detected within a shard. '''
+    logger = get_logger("SHARDS")
+    context = get_context("spawn")
+    inboxes = [context.Queue() for _ in range(config.shards)]
+    state = _ShardState(context, config.shards)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_run_shard,
+            args=(config, restart, shard, inboxes, state, results))
+        for shard in range(config.shards)]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {config.shards} shards.")
+
+    # An interrupt reaches the shards too, which stop handing out urls and
+    # report what they have. The coordinator then stops waiting for idle.
+    interrupted = list()
+    previous = signal.signal(
+        signal.SIGINT, lambda signum, frame: interrupted.append(signum))
+
+    # Done once every shard is idle and all urls sent were received, twice
+    # in a row with no change in between.
+    last = None
+    while not state.done.is_set():
+        time.sleep(config.shard_flush_interval)
+        if interrupted:
+            logger.info("Interrupted, waiting for the shards' reports.")
+            signal.signal(signal.SIGINT, previous)
+            state.done.set()
+            break
+        if not any(process.is_alive() for process in processes):
+            break
+        snapshot = (list(state.idle), sum(state.sent), sum(state.received))
+        if all(snapshot[0]) and snapshot[1] == snapshot[2] and snapshot == last:
+            state.done.set()
+        last = snapshot
+
+    finished = 0
+    while finished < len(processes):
+        try:
+            shard, report_state = results.get(timeout=1)
+        except Empty:
+            if not any(process.is_alive() for process in processes):
+                logger.error("A shard stopped without its report.")
+                break
+            continue
+        Report.add_state(report_state)
+        finished += 1
+        logger.info(f"Shard {shard} finished.")
+    # Every shard has forwarded its last urls, see _run_shard.
+    for inbox in inboxes:
+        inbox.put(None)
+    for process in processes:
+        process.join()
+    signal.signal(signal.SIGINT, previous)
+    logger.info(
+        f"{sum(state.sent)} urls forwarded between shards. "
+        f"Writing the merged report.")
+    Report.write_report_to_file()
+
+
+def _run_shard(config, restart, shard, inboxes, state, results):
+    # Runs in a shard process.
+    from crawler import Crawler
+    from crawler.async_crawler import AsyncCrawler
+
+    directory = os.path.abspath(os.path.join("shards", str(shard)))
+    os.makedirs(directory, exist_ok=True)
+    config.save_file = os.path.join(directory, os.path.basename(config.save_file))
+    if config.archive:
+        config.archive = os.path.join(os.path.abspath(config.archive), f"shard{shard}")
+    if config.metrics_port:
+        config.metrics_port += shard
+    os.chdir(directory)
+
+    frontier_factory = partial(
+        ShardedFrontier, shard=shard, ring=HashRing(config.shards),
+        inboxes=inboxes, state=state)
+    crawler_class = AsyncCrawler if config.engine == "async" else Crawler
+    crawler = crawler_class(config, restart, frontier_factory)
+    crawler.start()
+    # The last batches are in the other shards' inboxes before the report
+    # tells the coordinator that this shard is done.
+    for i, inbox in enumerate(inboxes):
+        if i != shard:
+            inbox.close()
+            inbox.join_thread()
+    results.put((shard, Report.get_state()))
+    crawler.frontier.stop_receiver()
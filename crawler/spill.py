@@ -0,0 +1,178 @@
+import os
+import mmap
+import shutil
+import struct
+
+from collections import deque
+
+
+class SpillStore(object):
+    ''' Segment files holding pending urls that did not fit in memory.
+
+    memory counts the characters (len) of the urls that HostQueues hold in
+    memory, not what the str objects and deque slots take, which is about 60
+    bytes more per url. Once it goes over memory_budget, the frontier spills
+    the newest urls of the largest queues to segments of up to segment_urls
+    urls. A segment is a
+    sequence of length-prefixed utf-8 urls, read back whole (through mmap if
+    use_mmap) when its queue gets to it. Segments that were read back are
+    only deleted by purge, once a checkpoint no longer refers to them. A
+    memory_budget of 0 never spills. '''
+    LENGTH = struct.Struct("<I")
+
+    def __init__(self, directory, memory_budget, segment_urls=4096, use_mmap=False):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.segment_urls = segment_urls
+        self.use_mmap = use_mmap
+        self.memory = 0
+        self.on_disk = 0
+        self.retired = list()
+        self.next_segment = 0
+        # Memory below which the frontier does not try to spill again.
+        self.floor = 0
+        if os.path.isdir(directory):
+            names = [int(name.split(".")[0]) for name in os.listdir(directory)
+                     if name.endswith(".seg")]
+            self.next_segment = max(names, default=-1) + 1
+
+    def over_budget(self):
+        return (bool(self.memory_budget)
+                and self.memory > max(self.memory_budget, self.floor))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, urls):
+        ''' Writes urls to a new segment and returns its name. '''
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.next_segment:08d}.seg"
+        self.next_segment += 1
+        pack = self.LENGTH.pack
+        with open(self._path(name), "wb") as f:
+            f.write(b"".join(
+                pack(len(data)) + data
+                for data in (url.encode("utf-8") for url in urls)))
+        return name
+
+    def read(self, name):
+        ''' The urls of a segment, in order. '''
+        if not os.path.exists(self._path(name)):
+            # Deleted by hand, or the save file was replaced.
+            return list()
+        with open(self._path(name), "rb") as f:
+            if self.use_mmap and os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._decode(data)
+            return self._decode(f.read())
+
+    def _decode(self, data):
+        urls = list()
+        size = self.LENGTH.size
+        offset = 0
+        while offset < len(data):
+            (length,) = self.LENGTH.unpack_from(data, offset)
+            offset += size
+            urls.append(bytes(data[offset:offset + length]).decode("utf-8"))
+            offset += length
+        return urls
+
+    def retire(self, name):
+        self.retired.append(name)
+
+    def take_retired(self):
+        ''' Segments read back since the last call, for purge once a
+        checkpoint taken now has been written. '''
+        retired, self.retired = self.retired, list()
+        return retired
+
+    def purge(self, names):
+        for name in names:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def keep_only(self, names):
+        ''' Deletes every segment not in names, after a resume. '''
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name not in names:
+                os.remove(self._path(name))
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        self.memory = 0
+        self.on_disk = 0
+        self.retired = list()
+        self.next_segment = 0
+
+
+class HostQueue(object):
+    ''' The pending urls of one host, first in first out: a head read back
+    from disk, the host's spilled segments, then a tail of the urls added
+    since. '''
+    __slots__ = ("store", "head", "segments", "tail", "spilled")
+
+    def __init__(self, store):
+        self.store = store
+        self.head = deque()
+        # (segment name, number of urls)
+        self.segments = deque()
+        self.tail = deque()
+        self.spilled = 0
+
+    def append(self, url):
+        self.tail.append(url)
+        self.store.memory += len(url)
+
+    def add_segment(self, name, count):
+        self.segments.append((name, count))
+        self.spilled += count
+        self.store.on_disk += count
+
+    def popleft(self):
+        ''' The oldest url, or None once the queue is empty. Segments that
+        are missing on disk are skipped. '''
+        while not self.head:
+            if self.segments:
+                name, count = self.segments.popleft()
+                self.head.extend(self.store.read(name))
+                self.store.retire(name)
+                self.spilled -= count
+                self.store.on_disk -= count
+                self.store.memory += sum(map(len, self.head))
+            elif self.tail:
+                self.head, self.tail = self.tail, self.head
+            else:
+                return None
+        url = self.head.popleft()
+        self.store.memory -= len(url)
+        return url
+
+    def spill(self):
+        ''' Moves the tail to segments on disk. A queue with nothing else in
+        memory or on disk keeps its next segment_urls urls in memory, as its
+        head, so that it is not read back right away. Returns the number of
+        urls spilled. '''
+        urls = list(self.tail)
+        self.tail.clear()
+        step = self.store.segment_urls
+        if not self.head and not self.segments:
+            self.head.extend(urls[:step])
+            urls = urls[step:]
+        for start in range(0, len(urls), step):
+            chunk = urls[start:start + step]
+            self.add_segment(self.store.write(chunk), len(chunk))
+        self.store.memory -= sum(map(len, urls))
+        return len(urls)
+
+    def in_memory(self):
+        yield from self.head
+        yield from self.tail
+
+    def segment_names(self):
+        return [name for name, _ in self.segments]
+
+    def __len__(self):
+        return len(self.head) + self.spilled + len(self.tail)
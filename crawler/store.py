@@ -0,0 +1,201 @@
+import os
+import time
+import shelve
+import sqlite3
+
+from threading import RLock, Timer, current_thread
+
+from utils.metrics import metrics
+
+
+class Store(object):
+    ''' Persistent map of urlhash -> (url, completed) used by the Frontier.
+
+    Writes are group-committed: they become durable once commit_every writes
+    have accumulated or commit_interval seconds have passed since the last
+    commit, whichever comes first. A timer commits the group then if no
+    further write comes. What a crash leaves depends on the backend, see
+    SQLiteStore and ShelveStore. '''
+
+    def __init__(self, path, commit_every=1, commit_interval=0.0):
+        self.path = path
+        self.commit_every = max(1, commit_every)
+        self.commit_interval = commit_interval
+        self.lock = RLock()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        self._timer = None
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(path)
+
+    @classmethod
+    def remove(cls, path):
+        os.remove(path)
+
+    def put(self, urlhash, url, completed):
+        with self.lock:
+            self._write(urlhash, url, completed)
+            self._uncommitted += 1
+            waited = time.monotonic() - self._last_commit
+            if (self._uncommitted >= self.commit_every
+                    or waited >= self.commit_interval):
+                self.commit()
+            elif self._timer is None:
+                self._timer = Timer(
+                    self.commit_interval - waited, self._commit_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _commit_on_timer(self):
+        with self.lock:
+            # Unless a commit came first and maybe started another timer.
+            if self._timer is current_thread():
+                self._timer = None
+                self.commit()
+
+    def commit(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._uncommitted:
+                start = metrics.clock()
+                self._commit()
+                metrics.observe("frontier_sync", start)
+            self._uncommitted = 0
+            self._last_commit = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self._close()
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class ShelveStore(Store):
+    ''' The original shelve (dbm) save file. dbm gives no guarantee about
+    writes that were not committed when the process crashed: any of them
+    may be lost, and the file may need to be rebuilt with --restart. '''
+
+    def __init__(self, path, commit_every=1, commit_interval=0.0):
+        super().__init__(path, commit_every, commit_interval)
+        self.save = shelve.open(path)
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return urlhash in self.save
+
+    def __len__(self):
+        with self.lock:
+            return len(self.save)
+
+    def get(self, urlhash):
+        with self.lock:
+            return self.save.get(urlhash)
+
+    def values(self):
+        with self.lock:
+            return list(self.save.values())
+
+    def items(self):
+        with self.lock:
+            return list(self.save.items())
+
+    def _write(self, urlhash, url, completed):
+        self.save[urlhash] = (url, completed)
+
+    def _commit(self):
+        self.save.sync()
+
+    def _close(self):
+        self.save.close()
+
+
+class SQLiteStore(Store):
+    ''' SQLite save file in WAL mode. A commit appends to the write-ahead log
+    instead of rewriting pages, and an interrupted transaction is rolled back
+    when the file is next opened, so after a crash the file holds the writes
+    of every committed group, in order, and none of the last one. '''
+
+    def __init__(self, path, commit_every=1, commit_interval=0.0):
+        super().__init__(path, commit_every, commit_interval)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL) WITHOUT ROWID")
+        self.conn.commit()
+
+    @classmethod
+    def remove(cls, path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM urls WHERE urlhash = ?",
+                (urlhash,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def get(self, urlhash):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, completed FROM urls WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def values(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, completed FROM urls").fetchall()
+        return [(url, bool(completed)) for url, completed in rows]
+
+    def items(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT urlhash, url, completed FROM urls").fetchall()
+        return [
+            (urlhash, (url, bool(completed)))
+            for urlhash, url, completed in rows]
+
+    def _write(self, urlhash, url, completed):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO urls (urlhash, url, completed) "
+            "VALUES (?, ?, ?)", (urlhash, url, int(completed)))
+
+    def _commit(self):
+        self.conn.commit()
+
+    def _close(self):
+        self.conn.close()
+
+
+STORES = {
+    "shelve": ShelveStore,
+    "sqlite": SQLiteStore,
+}
+
+
+def get_store_class(config):
+    try:
+        return STORES[config.save_store]
+    except KeyError:
+        raise ValueError(
+            f"Unknown STORE {config.save_store!r}, "
+            f"expected one of {', '.join(STORES)}.")
+
+
+def open_store(config):
+    return get_store_class(config)(
+        config.save_file, config.commit_every, config.commit_interval)
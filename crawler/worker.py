@@ -1,11 +1,26 @@
+import sqlite3
 from threading import Thread
 
+from concurrent.futures.process import BrokenProcessPool
 from inspect import getsource
+from requests import RequestException
 from utils.download import download
 from utils import get_logger
+from utils.log import log_event
 import scraper
-import time
-from report import Report
+from crawler.parse_pool import get_parse_pool
+from crawler.archive import get_archive
+
+# Errors of the crawl rather than of one url, after which every url would
+# fail: the parse processes died, or the save file or the disk failed.
+# Failed requests are OSErrors too, but only fail their url.
+CRAWL_ERRORS = (BrokenProcessPool, OSError, sqlite3.Error)
+
+
+def is_crawl_error(error):
+    ''' True if error stops the crawl, rather than only fail its url. '''
+    return (isinstance(error, CRAWL_ERRORS)
+            and not isinstance(error, RequestException))
 
 
 class Worker(Thread):
@@ -13,6 +28,11 @@ class Worker(Thread):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        # Parsing is done in a pool of processes if configured, this thread
+        # then only downloads and merges the results.
+        self.parse_pool = get_parse_pool(config) if config.parse_processes else None
+        # Responses are recorded for replay if configured.
+        self.archive = get_archive(config)
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
@@ -22,15 +42,53 @@ class Worker(Thread):
         while True:
             tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                Report.write_report_to_file()
+                # Nothing pending or in flight. The crawler writes the
+                # report once every worker stopped.
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
+            try:
+                self.crawl(tbd_url)
+            except Exception as e:
+                if not is_crawl_error(e):
+                    self._failed(tbd_url)
+                    continue
+                # Other workers finish their urls and stop. tbd_url stays
+                # in flight, so the checkpoint keeps it pending.
+                self.logger.exception(
+                    f"Failed to crawl {tbd_url}, stopping the crawl.")
+                self.frontier.stop()
+                raise
+
+    def _failed(self, tbd_url):
+        # Only this url failed. Other workers wait for urls in flight, so it
+        # must not stay in flight.
+        self.logger.exception(f"Failed to crawl {tbd_url}.")
+        self.frontier.mark_url_complete(tbd_url)
+
+    def crawl(self, tbd_url):
+        if not self.frontier.check_robots(tbd_url, self.logger):
+            self.logger.info(f"Skipped {tbd_url}, disallowed by robots.txt.")
+            log_event("robots_disallowed", url=tbd_url)
+            return
+        resp = download(tbd_url, self.config, self.logger)
+        self.logger.info(
+            f"Downloaded {tbd_url}, status <{resp.status}>, "
+            f"using cache {self.config.cache_server}.")
+        # Responses the scraper skips on their size are not unpickled for the
+        # archive or the page history either.
+        content, _, _, reason, _ = scraper.gate_response(resp)
+        if self.archive is not None:
+            self.archive.append(tbd_url, resp, reason != "too_large")
+        changed = self.frontier.record_visit(tbd_url, resp, content)
+        if not changed:
+            # Unchanged since the last crawl, nothing new to scrape.
+            scraped_urls = list()
+        elif self.parse_pool:
+            scraped_urls = self.parse_pool.scrape(tbd_url, resp)
+        else:
             scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+        log_event(
+            "fetch", url=tbd_url, status=resp.status, bytes=resp.size,
+            links=len(scraped_urls), changed=changed)
+        for scraped_url in scraped_urls:
+            self.frontier.add_url(scraped_url)
+        self.frontier.mark_url_complete(tbd_url)
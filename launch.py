@@ -4,20 +4,48 @@ from argparse import ArgumentParser
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.async_crawler import AsyncCrawler
+from crawler.replay import replay
+from crawler.sharding import run_sharded
 
-def main(config_file, restart):
+def main(config_file, restart, revalidate, engine, replay_archive, shards,
+         recrawl):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
+    if replay_archive:
+        # Re-analyze recorded responses, without the cache server.
+        config.archive = replay_archive
+        replay(config)
+        return
     config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    config.revalidate = revalidate
+    config.recrawl = recrawl
+    if engine:
+        config.engine = engine
+    if shards:
+        config.shards = shards
+    if config.shards > 1:
+        run_sharded(config, restart)
+        return
+    if config.engine == "async":
+        crawler = AsyncCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart)
     crawler.start()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--revalidate", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=["threads", "async"], default=None)
+    parser.add_argument("--replay", type=str, default=None, metavar="ARCHIVE")
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--recrawl", action="store_true", default=False)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(
+        args.config_file, args.restart, args.revalidate, args.engine,
+        args.replay, args.shards, args.recrawl)
 
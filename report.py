@@ -1,8 +1,12 @@
+from array import array
 from collections import defaultdict, Counter
-from urllib.parse import urlparse, urldefrag
-from lxml import html
+from hashlib import blake2b
+from threading import Lock, local
+from urllib.parse import urlparse
 import re
 
+from utils.canonical import canonicalize
+
 class Page:
     def __init__(self, url, numWords):
         self.url = url
@@ -11,12 +15,47 @@ class Page:
     def __repr__(self):
         return f"Page({self.url}, {self.numWords})" 
 
+class ReportShard:
+    ''' The part of the report added by one worker thread since it was last
+    merged. Only its own thread writes to it, the lock is there for merges. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        self.unique_pages = set()
+        self.longestPage = Page("", float('-inf'))
+        self.commonWords = Counter()
+        self.subdomains = defaultdict(int)
+        self.pages = 0
+        # Words whose count was lowered, which may be left at zero.
+        self.shrunk = set()
+
 class Report:
+    # Totals of every shard merged so far. Unique pages are kept as 64 bit
+    # hashes of their defragmented url. Call merge() before reading these.
     unique_pages = set()
     longestPage = Page("", float('-inf'))
     commonWords = Counter()
     subdomains = defaultdict(int)
 
+    # A shard is merged once it holds this many pages, so shards stay small
+    # even between checkpoints.
+    shard_pages = 256
+    # The page history (PAGE_HISTORY) if there is one. It keeps the words
+    # counted for each page, so a page that changed on a recrawl replaces
+    # its counts instead of being counted twice.
+    history = None
+    # Set by the frontier: a page merged for a frontier url is only counted
+    # once complete is called for that url, so a copy of the report taken
+    # along with the frontier's has the pages of the completed urls only.
+    hold_pages = False
+    _held = dict()
+    _held_lock = Lock()
+    _shards = []
+    _local = local()
+    _lock = Lock()
+
     # Taken from Default English stopwords list 
     # Credit: https://www.ranks.nl/stopwords
     stop_words = {
@@ -37,75 +76,179 @@ class Report:
         "you've", "your", "yours", "yourself", "yourselves"
     }
 
+    # Text inside these tags is not counted as words of the page
+    ignored_tags = {'script', 'style', 'noscript', 'head', 'meta', 'link', 'iframe', 'code', 'pre'}
+
     @classmethod
-    def update_report(cls, resp):
-        cls._add_unique_pages(resp.url)
-        cls.add_subdomain(resp.url)
+    def merge_page(cls, url, word_counts, words_count, frontier_url=None):
+        # Adds one page whose words were counted by count_words, possibly in
+        # another process. url is the url the page was served from, and
+        # frontier_url the one it was downloaded for, if it was redirected.
+        if cls.hold_pages and frontier_url is not None:
+            with cls._held_lock:
+                cls._held[frontier_url] = (url, word_counts, words_count)
+            return
+        cls._count_page(url, word_counts, words_count, frontier_url)
 
-        words_count = cls.parse_words(cls._get_text_from_resp(resp))
-        newPage = Page(resp.url, words_count)
-        cls._update_longest_page(newPage)
-          
+    @classmethod
+    def complete(cls, frontier_url):
+        ''' Counts the page held for frontier_url, if any. '''
+        with cls._held_lock:
+            page = cls._held.pop(frontier_url, None)
+        if page is not None:
+            cls._count_page(*page, frontier_url)
 
     @classmethod
-    def _add_unique_pages(cls, url):
-        clean_url, _ = urldefrag(url)
-        cls.unique_pages.add(clean_url)
+    def _count_page(cls, url, word_counts, words_count, frontier_url):
+        previous = None
+        if cls.history is not None:
+            previous = cls.history.replace_words(
+                frontier_url or url, url, word_counts, words_count)
+        shard = cls._shard()
+        with shard.lock:
+            cls._add_unique_pages(url, shard)
+            if previous is None:
+                cls.add_subdomain(url, shard)
+            else:
+                # Counted before, only its words changed.
+                shard.commonWords.subtract(previous[0])
+                shard.shrunk.update(previous[0])
+
+            shard.commonWords.update(word_counts)
+            newPage = Page(url, words_count)
+            cls.update_longest_page(newPage, shard)
+            shard.pages += 1
+            full = shard.pages >= cls.shard_pages
+        if previous is not None and words_count < previous[1]:
+            cls._shrink_page(url)
+        elif full:
+            cls.merge()
 
     @classmethod
-    def update_longest_page(cls, page):
-        if page.numWords > cls.longestPage.numWords:
-            cls.longestPage = page
+    def _shrink_page(cls, url):
+        # The page lost words, so if it was the longest another page may be
+        # longer now.
+        cls.merge()
+        with cls._lock:
+            if cls.longestPage.url == url:
+                cls.longestPage = Page(*cls.history.longest_page())
 
     @classmethod
-    def parse_words(cls, words_iter):
-        count = 0
-        pattern = re.compile(r"^[A-Za-z']+$")
-        for word in words_iter:
-            if word in cls.stop_words:
-                continue
-            elif not pattern.match(word):
-                continue
-            else:
-                cls.commonWords[word] += 1
-                count += 1
+    def _shard(cls):
+        # The calling thread's shard, registered on first use.
+        shard = getattr(cls._local, "shard", None)
+        if shard is None:
+            shard = cls._local.shard = ReportShard()
+            with cls._lock:
+                cls._shards.append(shard)
+        return shard
+
+    @classmethod
+    def merge(cls):
+        ''' Folds every shard into the class-level totals. '''
+        with cls._lock:
+            for shard in cls._shards:
+                with shard.lock:
+                    cls.unique_pages.update(shard.unique_pages)
+                    cls.commonWords.update(shard.commonWords)
+                    for word in shard.shrunk:
+                        if cls.commonWords.get(word, 0) <= 0:
+                            cls.commonWords.pop(word, None)
+                    for domain, count in shard.subdomains.items():
+                        cls.subdomains[domain] += count
+                    if shard.longestPage.numWords > cls.longestPage.numWords:
+                        cls.longestPage = shard.longestPage
+                    shard.clear()
 
-        return count
-        
     @classmethod
-    def add_subdomain(cls, url):
+    def get_state(cls):
+        ''' Picklable snapshot of the whole report, for checkpoints. '''
+        cls.merge()
+        with cls._lock:
+            return {
+                "unique_pages": array("Q", cls.unique_pages).tobytes(),
+                "longestPage": (cls.longestPage.url, cls.longestPage.numWords),
+                "commonWords": dict(cls.commonWords),
+                "subdomains": dict(cls.subdomains)}
+
+    @classmethod
+    def add_state(cls, state):
+        ''' Adds a snapshot from get_state, for example another shard's. '''
+        cls.merge()
+        with cls._lock:
+            unique_pages = array("Q")
+            unique_pages.frombytes(state["unique_pages"])
+            cls.unique_pages.update(unique_pages)
+            longestPage = Page(*state["longestPage"])
+            if longestPage.numWords > cls.longestPage.numWords:
+                cls.longestPage = longestPage
+            cls.commonWords.update(state["commonWords"])
+            for domain, count in state["subdomains"].items():
+                cls.subdomains[domain] += count
+
+    @classmethod
+    def set_state(cls, state):
+        ''' Restores a snapshot from get_state, so a resumed crawl continues
+        its counts. '''
+        with cls._lock:
+            for shard in cls._shards:
+                with shard.lock:
+                    shard.clear()
+            unique_pages = array("Q")
+            unique_pages.frombytes(state["unique_pages"])
+            cls.unique_pages = set(unique_pages)
+            cls.longestPage = Page(*state["longestPage"])
+            cls.commonWords = Counter(state["commonWords"])
+            cls.subdomains = defaultdict(int, state["subdomains"])
+
+    @staticmethod
+    def _get_page_hash(url):
+        # Pages are unique by canonical url, fragment excluded.
+        clean_url = canonicalize(url)
+        return int.from_bytes(
+            blake2b(clean_url.encode("utf-8"), digest_size=8).digest(), "little")
+
+    @classmethod
+    def _add_unique_pages(cls, url, shard=None):
+        shard = shard or cls._shard()
+        shard.unique_pages.add(cls._get_page_hash(url))
+
+    @classmethod
+    def update_longest_page(cls, page, shard=None):
+        shard = shard or cls._shard()
+        if page.numWords > shard.longestPage.numWords:
+            shard.longestPage = page
+
+    word_pattern = re.compile(r"[A-Za-z']+")
+
+    @classmethod
+    def count_words(cls, words_iter):
+        # Counts the words that make it into the report, without changing it.
+        # All words are counted in one Counter call, then the stop words and
+        # words that are not made of letters are dropped, once per distinct
+        # word instead of once per occurrence.
+        word_counts = Counter(words_iter)
+        for word in [word for word in word_counts
+                     if word in cls.stop_words or not cls.word_pattern.fullmatch(word)]:
+            del word_counts[word]
+
+        return word_counts, sum(word_counts.values())
+
+    @classmethod
+    def add_subdomain(cls, url, shard=None):
+        shard = shard or cls._shard()
         url_obj = urlparse(url)
         if url_obj.hostname:
-            cls.subdomains[url_obj.hostname.lower().strip()] += 1
+            shard.subdomains[url_obj.hostname.lower().strip()] += 1
 
     @classmethod
-    def _get_text_from_resp(cls, resp):
-        ignored_tags = {'script', 'style', 'noscript', 'head', 'meta', 'link', 'iframe', 'code', 'pre'}
-        try:
-            content_type = resp.raw_response.headers.get('Content-Type', '').lower()
-            content_disp = resp.raw_response.headers.get('Content-Disposition', '').lower()
-            if 'attachment' in content_disp or not content_type.startswith('text/html'):
-                return []
-
-            tree = html.fromstring(resp.raw_response.content.decode('utf-8', errors='ignore'))
-            body = tree.find('body')
-
-            if body is None:
-                return []
-            
-            html.etree.strip_elements(body, *ignored_tags, with_tail=True)
-
-            for text in body.itertext():
-                text = text.strip()
-                if text:
-                    for word in text.split():
-                        yield word.lower()
-
-        except:
-            return []
-        
+    def get_words(cls, texts):
+        # The text blocks are joined, lowercased and split in one go.
+        return " ".join(texts).lower().split()
+
     @classmethod
     def write_report_to_file(cls, filename = "Logs/REPORT.txt"):
+        cls.merge()
         with open(filename, 'w', encoding = 'utf-8') as f:
             f.write("=========Unique Pages=========\n")
             f.write(str(len(cls.unique_pages)))
@@ -1,13 +1,70 @@
 import re
-from urllib.parse import urlparse, urldefrag, urljoin, parse_qs
+from urllib.parse import urljoin, urlparse
+
+from collections import Counter
 
 from lxml import html, etree
 
 from report import Report
+from utils.url_filter import URLFilter
+from utils.fingerprint import DuplicateDetector
+from utils.traps import TrapDetector
+from utils.robots import RobotsCache
+from utils.metrics import metrics
+from utils.canonical import canonicalizer, canonicalize
+
+# Responses larger than this many bytes are parsed in streaming mode, so the
+# whole tree is never held in memory. 0 disables streaming. See configure.
+streaming_parse_bytes = 0
+
+# Pages that repeat the words of a page seen before. Their links are not
+# followed, since they lead into the same mirror or trap. See configure.
+duplicate_detector = DuplicateDetector()
+
+# Bodies larger than this many bytes are cut to it (max_body_action
+# "truncate") or not parsed at all ("skip"). 0 parses every body whole.
+# See configure.
+max_body_bytes = 0
+max_body_action = "truncate"
+
+# Links are followed from successful responses of these content types, or
+# without a Content-Type if the body does not look binary.
+LINK_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+# Parse seconds and body bytes seen so far, to estimate the time that gated
+# responses saved.
+_parse_cost = [0.0, 0]
+
+# Url templates (numbers and query values replaced) that keep yielding pages
+# without new content are cut off. Shared with the frontier. See configure.
+trap_detector = TrapDetector()
+
+# robots.txt rules of every host, fetched by the workers before a host is
+# first downloaded from. Shared with the frontier, which saves them and
+# honors crawl-delay. None if robots.txt is ignored. See configure.
+robots = None
+
+def configure(config):
+    global streaming_parse_bytes, duplicate_detector, trap_detector
+    global max_body_bytes, max_body_action, robots
+    streaming_parse_bytes = config.streaming_parse_bytes
+    max_body_bytes = config.max_body_bytes
+    max_body_action = config.max_body_action
+    duplicate_detector = DuplicateDetector(
+        config.near_duplicate_distance, config.duplicate_min_words)
+    trap_detector = TrapDetector(
+        config.trap_template_budget, config.trap_min_samples,
+        config.trap_min_novelty)
+    robots = RobotsCache(config) if config.robots else None
+    # Also done in parse processes, so they only time pages if enabled, and
+    # canonicalize links the same way as the frontier.
+    metrics.configure(config)
+    canonicalizer.configure(config)
 
 def scraper(url, resp):
-    links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    # extract_next_links already dropped the links is_valid rejects, parsing
+    # each link only once.
+    return extract_next_links(url, resp)
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -19,178 +76,406 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    Report.update_report(resp)
 
-    if resp.status != 200:
-        return list()
-    elif resp.raw_response is None or resp.raw_response.content is None:
-        return list()
+    return apply_analysis(url, resp.url, analyze_page(resp))
+
+
+class PageAnalysis:
+    # What extract_next_links needs from a page that does not depend on the
+    # crawl state, so that it can be computed in a parse process.
+    # links_found, rejected (rule -> links) and timings (stage -> seconds)
+    # are reported to the metrics by the process that applies the analysis.
+    # gated is the reason gate_response gave, if any, and skipped_bytes the
+    # part of the body that was not parsed because of it. collapsed counts
+    # the links that were spelled differently from their canonical url.
+    # parsed_hrefs holds urlparse of each of hrefs, so that the trap and
+    # robots checks do not parse them again.
+    def __init__(self, hrefs=(), word_counts=(), words_count=0, fingerprint=None,
+                 links_found=0, rejected=None, timings=None, gated=None,
+                 parsed_bytes=0, skipped_bytes=0, collapsed=0, parsed_hrefs=()):
+        self.hrefs = hrefs
+        self.parsed_hrefs = parsed_hrefs
+        self.word_counts = word_counts
+        self.words_count = words_count
+        self.fingerprint = fingerprint
+        self.links_found = links_found
+        self.rejected = rejected or Counter()
+        self.timings = timings or dict()
+        self.gated = gated
+        self.parsed_bytes = parsed_bytes
+        self.skipped_bytes = skipped_bytes
+        self.collapsed = collapsed
+
+def analyze_page(resp):
+    # The page is parsed once, links and report text come from the same parse.
+    start = metrics.clock()
+    gate = gate_response(resp)
+    document = parse_page(resp, gate)
+    words = Report.get_words(document.texts)
+    word_counts, words_count = Report.count_words(words)
+    fingerprint = duplicate_detector.fingerprint(words)
+    parsed = metrics.clock()
 
-    try:
-        tree = html.fromstring(resp.raw_response.content)
-    except etree.ParserError:
-        return list()
-        
-    # Gather all links from a page
-    hrefs = tree.xpath('//a/@href')
-    
     valid_hrefs = list()
+    parsed_hrefs = list()
+    rejected = Counter()
+    collapsed = 0
 
-    for href in hrefs:
+    for href in document.hrefs:
         try:
-            absolute_url = urljoin(resp.url, href) # Handle instances where href is a destination (i.e. `href=/target`)
-            if is_valid(absolute_url) and not _is_low_value_by_path(absolute_url) and not _is_low_value_by_query(absolute_url) and not _is_low_level_by_regex(absolute_url): 
-                valid_hrefs.append(_defragment(absolute_url))
+            joined_url = urljoin(resp.url, href) # Handle instances where href is a destination (i.e. `href=/target`)
+            absolute_url = _defragment(joined_url)
+            collapsed += absolute_url != joined_url
+            parsed_url = urlparse(absolute_url)
+            reason = url_filter.reject_reason(absolute_url, parsed=parsed_url)
+            if reason is None:
+                valid_hrefs.append(absolute_url)
+                parsed_hrefs.append(parsed_url)
+            else:
+                rejected[reason] += 1
         except:
+            rejected["error"] += 1
             continue
 
-    return valid_hrefs
+    timings = dict()
+    if metrics.enabled:
+        timings = {"parse": parsed - start, "filter": metrics.clock() - parsed}
+    content, _, _, reason, skipped_bytes = gate
+    return PageAnalysis(
+        valid_hrefs, word_counts, words_count, fingerprint,
+        len(document.hrefs), rejected, timings, reason,
+        len(content) if content is not None else 0, skipped_bytes, collapsed,
+        parsed_hrefs)
+
+def apply_analysis(url, resp_url, analysis):
+    # Merges a page into the report and the duplicate and trap detectors, and
+    # returns the links worth following: not in a blocked trap template and
+    # allowed by robots.txt (the rest of is_valid was checked by analyze_page).
+    Report.merge_page(
+        resp_url, analysis.word_counts, analysis.words_count, url)
+
+    duplicate = duplicate_detector.check_fingerprint(
+        resp_url, analysis.fingerprint) is not DuplicateDetector.UNIQUE
+    # Pages too short to fingerprint say nothing about the template's novelty.
+    trap_detector.record_page(
+        url, None if analysis.fingerprint is None else not duplicate)
+    links = list()
+    disallowed = 0
+    if not duplicate:
+        for href, parsed in zip(analysis.hrefs, analysis.parsed_hrefs):
+            if trap_detector.is_blocked(href, parsed):
+                continue
+            if robots is not None and not robots.allows(href, parsed):
+                disallowed += 1
+                continue
+            links.append(href)
+
+    if metrics.enabled:
+        for stage, seconds in analysis.timings.items():
+            metrics.observe_value(stage, seconds)
+        _count_gated(analysis)
+        metrics.count("links_discovered", analysis.links_found)
+        metrics.count("links_collapsed", analysis.collapsed)
+        for rule, rejected in analysis.rejected.items():
+            metrics.count("links_rejected", rejected, rule=rule)
+        if duplicate:
+            metrics.count("links_rejected", len(analysis.hrefs), rule="duplicate_page")
+        else:
+            metrics.count(
+                "links_rejected", len(analysis.hrefs) - len(links) - disallowed,
+                rule="trap_template")
+            metrics.count("links_rejected", disallowed, rule="robots")
+        metrics.count("links_accepted", len(links))
+    return links
+
+
+class Document:
+    # Links and report text of one response, taken from a single parse.
+    def __init__(self, hrefs=(), texts=()):
+        self.hrefs = hrefs
+        self.texts = texts
+
+def parse_page(resp, gate=None):
+    content, want_links, want_text, _, _ = gate or gate_response(resp)
+    if content is None:
+        return Document()
+
+    text = decode_page(content, resp.raw_response.headers.get('Content-Type', ''))
+    if streaming_parse_bytes and len(content) > streaming_parse_bytes:
+        return _parse_streaming(text, want_links, want_text)
+
+    try:
+        tree = html.fromstring(text)
+    except (etree.ParserError, ValueError):
+        return Document()
+
+    # Gather all links from a page, before the text pass strips elements.
+    hrefs = tree.xpath('//a/@href') if want_links else []
 
+    texts = []
+    body = tree.find('body') if want_text else None
+    if body is not None:
+        etree.strip_elements(body, *Report.ignored_tags, with_tail=True)
+        texts = list(body.itertext())
 
-# Removes the fragment part from URLs
+    return Document(hrefs, texts)
+
+def gate_response(resp):
+    ''' Decides from the status, headers and size alone what to parse, so
+    that no other response reaches lxml. Returns (content, want_links,
+    want_text, reason, skipped bytes). content is None if nothing is parsed,
+    and reason then says why. reason is "truncated" if content was cut to
+    max_body_bytes.
+
+    Links are only followed from successful responses, while the report
+    counts the words of every html response. '''
+    size = getattr(resp, "size", 0)
+    if max_body_bytes and max_body_action == "skip" and size > max_body_bytes:
+        # Known from the pickled payload, which is then never unpickled.
+        return None, False, False, "too_large", size
+    raw = resp.raw_response
+    content = getattr(raw, "content", None)
+    if content is None:
+        return None, False, False, "no_content", 0
+    try:
+        content_type = raw.headers.get('Content-Type', '').lower()
+        content_disp = raw.headers.get('Content-Disposition', '').lower()
+    except AttributeError:
+        return None, False, False, "no_headers", len(content)
+    if 'attachment' in content_disp:
+        return None, False, False, "attachment", len(content)
+
+    want_text = content_type.startswith('text/html')
+    want_links = resp.status == 200 and (
+        content_type.startswith(LINK_CONTENT_TYPES)
+        or not content_type and b"\0" not in content[:1024])
+    if not want_links and not want_text:
+        reason = "content_type" if resp.status == 200 else "status"
+        return None, False, False, reason, len(content)
+    if max_body_bytes and len(content) > max_body_bytes:
+        if max_body_action == "skip":
+            return None, False, False, "too_large", len(content)
+        return (content[:max_body_bytes], want_links, want_text, "truncated",
+                len(content) - max_body_bytes)
+    return content, want_links, want_text, None, 0
+
+# Charset declared by a meta tag, looked for in the first 1024 bytes.
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+
+# lxml refuses str input with an xml encoding declaration.
+_XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*>')
+
+# What lxml.html.fromstring takes for a whole document rather than a fragment.
+_FULL_HTML = re.compile(r'^\s*<(?:html|!doctype)', re.I)
+
+def decode_page(content, content_type=''):
+    ''' Decodes a body with the charset of its Content-Type header or of its
+    meta tag, utf-8 if neither declares one. Bytes that do not decode are
+    dropped. Both parse paths read the same text. '''
+    charset = 'utf-8'
+    _, _, declared = content_type.lower().partition('charset=')
+    declared = declared.split(';')[0].strip(' "\'')
+    if not declared:
+        match = _META_CHARSET.search(content[:1024])
+        declared = match.group(1).decode('ascii') if match else ''
+    if declared:
+        charset = declared
+    try:
+        text = content.decode(charset, errors='ignore')
+    except LookupError:
+        text = content.decode('utf-8', errors='ignore')
+    return _XML_DECLARATION.sub('', text, count=1)
+
+def _count_gated(analysis):
+    # Time saved is estimated from the parse time per byte seen so far.
+    if analysis.parsed_bytes and "parse" in analysis.timings:
+        _parse_cost[0] += analysis.timings["parse"]
+        _parse_cost[1] += analysis.parsed_bytes
+    if analysis.gated is None:
+        return
+    metrics.count("responses_gated", reason=analysis.gated)
+    if analysis.skipped_bytes:
+        metrics.count("bytes_not_parsed", analysis.skipped_bytes, reason=analysis.gated)
+        if _parse_cost[1]:
+            metrics.count(
+                "parse_seconds_saved",
+                analysis.skipped_bytes * _parse_cost[0] / _parse_cost[1])
+
+def _parse_streaming(text, want_links, want_text, chunk_size=1 << 16):
+    # Same hrefs and texts, in the same order, as the tree path, but elements
+    # are removed as soon as their text has been read, so memory stays flat
+    # on huge pages. The text of an element is complete once its first child
+    # starts or it ends, and a tail once the next sibling starts or the
+    # parent ends, which is when they are read.
+    ignored = Report.ignored_tags
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    hrefs = []
+    texts = []
+    # Whether the text of each open element has been read.
+    text_read = []
+    in_body = False
+    skip = 0
+    # fromstring only keeps the body of a whole document, or of a fragment
+    # with a head.
+    has_head = _FULL_HTML.match(text) is not None
+    has_body = False
+
+    def consume(nodes, keep):
+        for node in nodes:
+            if keep and node.tag not in ignored and node.tail:
+                texts.append(node.tail)
+            node.getparent().remove(node)
+
+    def handle(events):
+        nonlocal in_body, skip, has_head, has_body
+        for event, elem in events:
+            tag = elem.tag
+            inside = in_body and not skip
+            if event == "start":
+                if text_read:
+                    if not text_read[-1]:
+                        parent = elem.getparent()
+                        if inside and parent.text:
+                            texts.append(parent.text)
+                        text_read[-1] = True
+                    consume(reversed(list(elem.itersiblings(preceding=True))), inside)
+                text_read.append(False)
+                if tag == "head":
+                    has_head = True
+                elif tag == "body":
+                    has_body = True
+                    in_body = want_text
+                if tag in ignored:
+                    skip += 1
+                if want_links and tag == "a" and elem.get("href") is not None:
+                    hrefs.append(elem.get("href"))
+                continue
+            if not text_read.pop() and inside and elem.text:
+                texts.append(elem.text)
+            consume(list(elem), inside)
+            if tag in ignored:
+                skip -= 1
+            if tag == "body":
+                in_body = False
+
+    try:
+        for start in range(0, len(text), chunk_size):
+            parser.feed(text[start:start + chunk_size])
+            handle(parser.read_events())
+        parser.close()
+        handle(parser.read_events())
+    except etree.LxmlError:
+        pass
+
+    if not (has_head and has_body):
+        texts = []
+    return Document(hrefs, texts)
+
+# Removes the fragment part from URLs, along with every other difference in
+# spelling between urls of the same page (see utils/canonical.py)
 def _defragment(url) -> str:
-    clean_url, _ = urldefrag(url)
-    return clean_url
+    return canonicalize(url)
 
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
+    # The rules are listed below and compiled once into url_filter. Urls
+    # that the robots.txt of their host disallows are not crawled either.
+    return url_filter.is_valid(url) and (robots is None or robots.allows(url))
 
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        elif not _is_valid_domain(url):
-            return False
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
-
-# Returns True if the following url is considered a domain
-def _is_valid_domain(url):
-    allowed = [
-        '.ics.uci.edu',
-        '.cs.uci.edu',
-        '.informatics.uci.edu',
-        '.stat.uci.edu'
-    ]
-
-    parsed_url = urlparse(url)
-
-    for domains in allowed:
-        #netloc is network location aka domain
-        if parsed_url.netloc.lower().endswith(domains): 
-            return True
-    
-    return False    
+ALLOWED_SCHEMES = ["http", "https"]
+
+# A url is considered in domain if its netloc ends with one of these
+ALLOWED_DOMAINS = [
+    '.ics.uci.edu',
+    '.cs.uci.edu',
+    '.informatics.uci.edu',
+    '.stat.uci.edu'
+]
+
+IGNORED_EXTENSIONS = (
+    r".*\.(css|js|bmp|gif|jpe?g|ico"
+    + r"|png|tiff?|mid|mp2|mp3|mp4"
+    + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    + r"|epub|dll|cnf|tgz|sha1"
+    + r"|thmx|mso|arff|rtf|jar|csv"
+    + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$")
 
 # Determines if the pages are similar with no information
 # TODO: Try removing idx and do at the end
-def _is_low_value_by_query(url):
-    ignoredKeys = set([
-        'tab_files', 'tab_details', 'tab_upload', 
-        'idx', 'do', 'view', 'action',
-        'expanded', 'ref_tags', 'format', 'sort',
-        'tribe-bar-date',
-        'ical', 'outlook-ical', 'eventDisplay',
-        'share', 'display', 'redirect_to',
-        'from'
-    ])
-
-    parsed_url = urlparse(url)
-    query_dict = parse_qs(parsed_url.query)
-
-    for key in query_dict.keys():
-        if key in ignoredKeys:
-            return True
-        
-    return False
-
-def _is_low_value_by_path(url):
-    
-    ignored_paths = [
-        '/-/issues',
-        '/-/merge_requests',
-        '/-/forks',
-        '/-/starrers',
-        '/-/branches',
-        '/-/tags',
-        '/-/commit',
-        '/-/tree',
-        '/prof-david-redmiles'
-    ]
-
-    parsed_url = urlparse(url)
-    path = parsed_url.path
-
-    for pattern in ignored_paths:
-        if re.search(pattern, path):
-            return True
-    return False
-
-# Removes low level by regex
-def _is_low_level_by_regex(url):
-    parsed_url = urlparse(url)
-    regexes = [
-        re.compile(r"/day/\d{4}-\d{2}-\d{2}(/|$)"),
-        re.compile(r"/events/\d{4}-\d{2}-\d{2}(/|$)"),
-        re.compile(r"/events/month/\d{4}-\d{2}(/|$)"),
-        re.compile(r"/events/category(?:/[^/]+)?/\d{4}-\d{2}(/|$)"),
-        re.compile(r"/events/tag/talks/\d{4}-\d{2}(/|$)"),    
-        re.compile(r"/project-meeting/\d{4}-\d{2}(/|$)"),
-        re.compile(r"/talks/\d{4}-\d{2}(/|$)"),
-        re.compile(r"/talk/\d{4}-\d{2}(/|$)"),
-        re.compile(r"/~eppstein/pix"),
-        re.compile(r"/research/seminarseries/(\d{4}-\d{4})"),
-        re.compile(r"flamingo.ics.uci.edu/\d+\.\d+(?:\.\d+)?"),
-        re.compile(r"docs/[^/]+\.html"),
-        re.compile(r"www.ics.uci.edu/releases/"),
-        re.compile(r"sccv/[^/]+\.html"),
-        re.compile(r"malek.ics.uci.edu/[^ ,]+"),
-        re.compile(r"transformativeplay.ics.uci.edu"),
-        re.compile(r"cs295-2020"),
-        re.compile(r"cs134-20"),
-        re.compile(r"cs205-20"),
-        re.compile(r"mondego.ics.uci.edu"),
-        re.compile(r"thornton/ProjectGuide"),
-        re.compile(r"thornton/Lab"),
-        re.compile(r"thornton/CourseProject"),
-        re.compile(r"thornton/WritingAssignments"),
-        re.compile(r"drupal"),
-        re.compile(r"~eppstein/(?:[^/]+/)*[^/]+\.(py|c|h)$"),
-        re.compile(r"~eppstein/numth/(?:[^/]+/)*[^/]+\.html$"),
-        re.compile(r"~eppstein/ca/b[^/]+\.(lif|html)$"),
-        re.compile(r"ca/rules/"),
-        re.compile(r"~eppstein/hw"),
-        re.compile(r"~eppstein/w25"),
-        re.compile(r"~eppstein/s25"),
-        re.compile(r"eppstein/163/s\d{2}[^/]*\.txt$"),
-        re.compile(r"~lab/schedules"),
-        re.compile(r"tmbpro.ics.uci.edu"),
-        re.compile(r"mine10.ics.uci.edu"),
-        re.compile(r"reactions.ics.uci.edu"),
-        re.compile(r".npy"),
-        re.compile(r"fall98/chapter"),
-        re.compile(r"MJCarey"),
-        re.compile(r"~dechter/[^/]+\.html$"),
-        re.compile(r".xhtml"),
-        re.compile(r"~dechter/r\d{2,}\.html$"),
-        re.compile(r"jutts/Midterm")
-    ]
-
-    for regex in regexes:
-        if regex.search(parsed_url.path):
-            return True
-        
-    return False
\ No newline at end of file
+IGNORED_QUERY_KEYS = [
+    'tab_files', 'tab_details', 'tab_upload', 
+    'idx', 'do', 'view', 'action',
+    'expanded', 'ref_tags', 'format', 'sort',
+    'tribe-bar-date',
+    'ical', 'outlook-ical', 'eventDisplay',
+    'share', 'display', 'redirect_to',
+    'from'
+]
+
+IGNORED_PATHS = [
+    '/-/issues',
+    '/-/merge_requests',
+    '/-/forks',
+    '/-/starrers',
+    '/-/branches',
+    '/-/tags',
+    '/-/commit',
+    '/-/tree',
+    '/prof-david-redmiles'
+]
+
+# Removes low level by regex, searched in the url path
+TRAP_PATTERNS = [
+    r"/day/\d{4}-\d{2}-\d{2}(/|$)",
+    r"/events/\d{4}-\d{2}-\d{2}(/|$)",
+    r"/events/month/\d{4}-\d{2}(/|$)",
+    r"/events/category(?:/[^/]+)?/\d{4}-\d{2}(/|$)",
+    r"/events/tag/talks/\d{4}-\d{2}(/|$)",
+    r"/project-meeting/\d{4}-\d{2}(/|$)",
+    r"/talks/\d{4}-\d{2}(/|$)",
+    r"/talk/\d{4}-\d{2}(/|$)",
+    r"/~eppstein/pix",
+    r"/research/seminarseries/(\d{4}-\d{4})",
+    r"flamingo.ics.uci.edu/\d+\.\d+(?:\.\d+)?",
+    r"docs/[^/]+\.html",
+    r"www.ics.uci.edu/releases/",
+    r"sccv/[^/]+\.html",
+    r"malek.ics.uci.edu/[^ ,]+",
+    r"transformativeplay.ics.uci.edu",
+    r"cs295-2020",
+    r"cs134-20",
+    r"cs205-20",
+    r"mondego.ics.uci.edu",
+    r"thornton/ProjectGuide",
+    r"thornton/Lab",
+    r"thornton/CourseProject",
+    r"thornton/WritingAssignments",
+    r"drupal",
+    r"~eppstein/(?:[^/]+/)*[^/]+\.(py|c|h)$",
+    r"~eppstein/numth/(?:[^/]+/)*[^/]+\.html$",
+    r"~eppstein/ca/b[^/]+\.(lif|html)$",
+    r"ca/rules/",
+    r"~eppstein/hw",
+    r"~eppstein/w25",
+    r"~eppstein/s25",
+    r"eppstein/163/s\d{2}[^/]*\.txt$",
+    r"~lab/schedules",
+    r"tmbpro.ics.uci.edu",
+    r"mine10.ics.uci.edu",
+    r"reactions.ics.uci.edu",
+    r".npy",
+    r"fall98/chapter",
+    r"MJCarey",
+    r"~dechter/[^/]+\.html$",
+    r".xhtml",
+    r"~dechter/r\d{2,}\.html$",
+    r"jutts/Midterm"
+]
+
+url_filter = URLFilter(
+    ALLOWED_SCHEMES, ALLOWED_DOMAINS, IGNORED_EXTENSIONS,
+    IGNORED_PATHS, IGNORED_QUERY_KEYS, TRAP_PATTERNS)
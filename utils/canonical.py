@@ -0,0 +1,133 @@
+import re
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, quote
+
+# Query and path parameters that only track the visitor or their session.
+# A trailing * matches any suffix.
+DEFAULT_STRIP_PARAMS = (
+    "utm_*", "fbclid", "gclid", "msclkid", "mc_cid", "mc_eid",
+    "jsessionid", "phpsessid", "sid", "sessionid")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+_PERCENT = re.compile(r"%([0-9A-Fa-f]{2})")
+
+# Characters left as they are in a path, and in a query parameter. Anything
+# else (spaces, non-ascii) is percent-encoded as UTF-8.
+_PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+_QUERY_SAFE = "/?:@!$'()*+,;=-._~%"
+
+
+class Canonicalizer(object):
+    ''' Rewrites urls that name the same page to one spelling, so they get
+    one urlhash, one frontier entry and one fetch.
+
+    The scheme and host are lowercased, default ports dropped, dot-segments
+    resolved and trailing slashes removed from the path, percent-encoding
+    normalized (unreserved characters decoded, hex in upper case), query
+    parameters sorted by name and tracking or session parameters dropped,
+    and the fragment removed. Results are memoized in a bounded LRU. '''
+
+    def __init__(self, strip_params=DEFAULT_STRIP_PARAMS, cache_size=65536):
+        self.configure_rules(strip_params, cache_size)
+
+    def configure(self, config):
+        self.configure_rules(
+            config.canonical_strip_params, config.canonical_cache_size)
+
+    def configure_rules(self, strip_params, cache_size):
+        self.strip_exact = frozenset(
+            param.lower() for param in strip_params if not param.endswith("*"))
+        self.strip_patterns = tuple(
+            param.lower() for param in strip_params if param.endswith("*"))
+        self._cached = lru_cache(maxsize=cache_size)(self._canonicalize)
+
+    def canonicalize(self, url):
+        return self._cached(url)
+
+    def stats(self):
+        ''' Cache hits and misses, for the metrics. '''
+        info = self._cached.cache_info()
+        return {"hits": info.hits, "misses": info.misses}
+
+    def _strip(self, param):
+        name = param.partition("=")[0].lower()
+        return name in self.strip_exact or any(
+            fnmatchcase(name, pattern) for pattern in self.strip_patterns)
+
+    def _canonicalize(self, url):
+        try:
+            parsed = urlsplit(url.strip())
+            port = parsed.port
+        except ValueError:
+            # Malformed netloc or port, left for the filters to reject.
+            return url
+        scheme = parsed.scheme.lower()
+        netloc = (parsed.hostname or "").rstrip(".")
+        if parsed.hostname and ":" in parsed.hostname:
+            netloc = f"[{netloc}]"
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            netloc = f"{netloc}:{port}"
+        if parsed.username is not None:
+            userinfo = parsed.username
+            if parsed.password is not None:
+                userinfo = f"{userinfo}:{parsed.password}"
+            netloc = f"{userinfo}@{netloc}"
+
+        # Session ids passed as path parameters, as in /a;jsessionid=...
+        segments = _normalize_escapes(parsed.path, _PATH_SAFE).split(";")
+        path = ";".join(
+            [segments[0]] + [
+                segment for segment in segments[1:]
+                if not self._strip(segment)])
+        path = _remove_dot_segments(path)
+        path = path.rstrip("/")
+
+        params = [
+            param for param in (
+                _normalize_escapes(param, _QUERY_SAFE)
+                for param in parsed.query.split("&") if param)
+            if not self._strip(param)]
+        # Sorted by name only, so repeated names keep their order.
+        params.sort(key=lambda param: param.partition("=")[0])
+        return urlunsplit((scheme, netloc, path, "&".join(params), ""))
+
+
+def _normalize_escapes(part, safe):
+    part = _PERCENT.sub(_normalize_escape, part)
+    return quote(part, safe=safe)
+
+
+def _normalize_escape(match):
+    char = chr(int(match.group(1), 16))
+    if char in UNRESERVED:
+        return char
+    return f"%{match.group(1).upper()}"
+
+
+def _remove_dot_segments(path):
+    # RFC 3986, section 5.2.4.
+    if "." not in path:
+        return path
+    output = list()
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    if path.endswith(("/.", "/..")):
+        output.append("")
+    return "/".join(output)
+
+
+# Shared by the frontier, the scraper and the report. See scraper.configure.
+canonicalizer = Canonicalizer()
+
+
+def canonicalize(url):
+    return canonicalizer.canonicalize(url)
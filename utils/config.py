@@ -1,5 +1,7 @@
 import re
 
+from utils.canonical import DEFAULT_STRIP_PARAMS
+
 
 class Config(object):
     def __init__(self, config):
@@ -8,12 +10,67 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config.get("LOCAL PROPERTIES", "ENGINE", fallback="threads")
+        self.max_in_flight = config.getint("LOCAL PROPERTIES", "MAX_IN_FLIGHT", fallback=100)
+        self.parse_processes = config.getint("LOCAL PROPERTIES", "PARSE_PROCESSES", fallback=0)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_store = config.get("LOCAL PROPERTIES", "STORE", fallback="shelve")
+        self.commit_every = config.getint("LOCAL PROPERTIES", "COMMIT_EVERY", fallback=1)
+        self.commit_interval = config.getfloat("LOCAL PROPERTIES", "COMMIT_INTERVAL_MS", fallback=0) / 1000
+        self.checkpoint_every = config.getint("LOCAL PROPERTIES", "CHECKPOINT_EVERY", fallback=1000)
+        self.seen_index = config.get("LOCAL PROPERTIES", "SEEN_INDEX", fallback="hashset")
+        self.bloom_capacity = config.getint("LOCAL PROPERTIES", "BLOOM_CAPACITY", fallback=2000000)
+        self.bloom_fp_rate = config.getfloat("LOCAL PROPERTIES", "BLOOM_FP_RATE", fallback=0.001)
+        self.pending_memory = config.getint("LOCAL PROPERTIES", "PENDING_MEMORY_MB", fallback=0) << 20
+        self.pending_segment_urls = config.getint("LOCAL PROPERTIES", "PENDING_SEGMENT_URLS", fallback=4096)
+        self.pending_mmap = config.getboolean("LOCAL PROPERTIES", "PENDING_MMAP", fallback=False)
+        self.shards = config.getint("LOCAL PROPERTIES", "SHARDS", fallback=1)
+        self.shard_batch = config.getint("LOCAL PROPERTIES", "SHARD_BATCH", fallback=64)
+        self.shard_flush_interval = config.getfloat("LOCAL PROPERTIES", "SHARD_FLUSH_INTERVAL_MS", fallback=500) / 1000
+        self.page_history = config.getboolean("LOCAL PROPERTIES", "PAGE_HISTORY", fallback=False)
+        self.recrawl_interval = config.getfloat("LOCAL PROPERTIES", "RECRAWL_INTERVAL_HOURS", fallback=24) * 3600
+        self.recrawl_min_interval = config.getfloat("LOCAL PROPERTIES", "RECRAWL_MIN_INTERVAL_HOURS", fallback=1) * 3600
+        self.recrawl_max_interval = config.getfloat("LOCAL PROPERTIES", "RECRAWL_MAX_INTERVAL_HOURS", fallback=720) * 3600
+        self.archive = config.get("LOCAL PROPERTIES", "ARCHIVE", fallback="").strip()
+        self.archive_segment_bytes = config.getint("LOCAL PROPERTIES", "ARCHIVE_SEGMENT_MB", fallback=64) << 20
+        self.metrics = config.getboolean("LOCAL PROPERTIES", "METRICS", fallback=False)
+        self.metrics_interval = config.getfloat("LOCAL PROPERTIES", "METRICS_INTERVAL", fallback=30)
+        self.metrics_port = config.getint("LOCAL PROPERTIES", "METRICS_PORT", fallback=0)
+        self.log_console = config.getboolean("LOCAL PROPERTIES", "LOG_CONSOLE", fallback=True)
+        self.event_log = config.get("LOCAL PROPERTIES", "EVENT_LOG", fallback="").strip()
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.download_timeout = config.getfloat("CONNECTION", "TIMEOUT", fallback=30)
+        self.download_retries = config.getint("CONNECTION", "RETRIES", fallback=3)
+        self.download_backoff = config.getfloat("CONNECTION", "BACKOFF", fallback=0.5)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.streaming_parse_bytes = config.getint("CRAWLER", "STREAMING_PARSE_BYTES", fallback=0)
+        self.canonical_strip_params = [
+            param.strip() for param in config.get(
+                "CRAWLER", "CANONICAL_STRIP_PARAMS",
+                fallback=",".join(DEFAULT_STRIP_PARAMS)).split(",")
+            if param.strip()]
+        self.canonical_cache_size = config.getint("CRAWLER", "CANONICAL_CACHE_SIZE", fallback=65536)
+        self.robots = config.getboolean("CRAWLER", "ROBOTS", fallback=False)
+        self.robots_ttl = config.getfloat("CRAWLER", "ROBOTS_TTL_HOURS", fallback=24) * 3600
+        self.robots_max_crawl_delay = config.getfloat("CRAWLER", "ROBOTS_MAX_CRAWL_DELAY", fallback=10)
+        self.robots_sitemap_urls = config.getint("CRAWLER", "ROBOTS_SITEMAP_URLS", fallback=10000)
+        self.max_body_bytes = config.getint("CRAWLER", "MAX_BODY_BYTES", fallback=0)
+        self.max_body_action = config.get("CRAWLER", "MAX_BODY_ACTION", fallback="truncate").strip()
+        assert self.max_body_action in ("truncate", "skip"), "MAX_BODY_ACTION should be truncate or skip"
+        self.near_duplicate_distance = config.getint("CRAWLER", "NEAR_DUPLICATE_DISTANCE", fallback=3)
+        self.duplicate_min_words = config.getint("CRAWLER", "DUPLICATE_MIN_WORDS", fallback=50)
+        self.trap_template_budget = config.getint("CRAWLER", "TRAP_TEMPLATE_BUDGET", fallback=1000)
+        self.trap_min_samples = config.getint("CRAWLER", "TRAP_MIN_SAMPLES", fallback=20)
+        self.trap_min_novelty = config.getfloat("CRAWLER", "TRAP_MIN_NOVELTY", fallback=0.1)
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # Set by launch.py --revalidate to rebuild the frontier from the
+        # whole save file instead of the last checkpoint.
+        self.revalidate = False
+        # Set by launch.py --recrawl to revisit the completed pages that are
+        # due, see PAGE_HISTORY.
+        self.recrawl = False
\ No newline at end of file
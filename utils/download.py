@@ -1,21 +1,238 @@
 import requests
 import cbor
 import time
+import random
+import asyncio
+
+from threading import local, Lock
+from urllib.parse import urlencode
+
+from requests.adapters import HTTPAdapter
 
 from utils.response import Response
+from utils.metrics import metrics
 
-def download(url, config, logger=None):
+# Statuses of the cache server itself (not of the page) worth retrying.
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+_thread_state = local()
+
+
+class DownloadStats(object):
+    ''' Counters shared by every worker's session. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.new_connections = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, retries, new_connections, failed):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += failed
+            self.new_connections += new_connections
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def summary(self):
+        with self.lock:
+            reused = self.requests + self.retries - self.new_connections
+            average = self.total_latency / self.requests if self.requests else 0.0
+            return (
+                f"{self.requests} downloads, {self.retries} retries, "
+                f"{self.failures} failures, {self.new_connections} new "
+                f"connections, {max(reused, 0)} reused, latency avg "
+                f"{average * 1000:.0f} ms max {self.max_latency * 1000:.0f} ms")
+
+
+stats = DownloadStats()
+
+
+def _get_session():
+    # One keep-alive session per worker thread, so consecutive downloads
+    # reuse the connection to the cache server.
+    session = getattr(_thread_state, "session", None)
+    if session is None:
+        session = _thread_state.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("http://", adapter)
+        _thread_state.adapter = adapter
+    return session
+
+
+def _connections_made():
+    pools = _thread_state.adapter.poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+def _fetch(session, url, config):
+    # One request to the cache server. Returns (response, error), where error
+    # says why the cache server's answer could not be used.
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        resp = session.get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+            timeout=config.download_timeout)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        error = f"Spacetime connection error {e!r} with url {url}."
+        return Response({"error": error, "status": None, "url": url}), error
+    return _decode(url, resp.status_code, resp.content)
+
+
+def _decode(url, status_code, content):
+    # Turns the cache server's answer into (response, error).
+    try:
+        if status_code < 400 and content:
+            return Response(cbor.loads(content)), None
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    error = f"Spacetime Response error <Response [{status_code}]> with url {url}."
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+        "error": error,
+        "status": status_code,
+        "url": url}), error
+
+
+def _is_transient(response, error):
+    return error is not None and (
+        response.status is None or response.status in TRANSIENT_STATUSES)
+
+
+def _backoff(config, retries):
+    # Exponential backoff with jitter, so workers do not retry in step.
+    return config.download_backoff * (2 ** retries) * random.uniform(0.5, 1.5)
+
+
+def download(url, config, logger=None):
+    session = _get_session()
+    connections = _connections_made()
+    start = time.monotonic()
+    retries = 0
+    while True:
+        response, error = _fetch(session, url, config)
+        if not _is_transient(response, error) or retries >= config.download_retries:
+            break
+        time.sleep(_backoff(config, retries))
+        retries += 1
+    latency = time.monotonic() - start
+    stats.record(
+        latency, retries, _connections_made() - connections, error is not None)
+    metrics.observe_value("download", latency)
+    if error and logger:
+        logger.error(error)
+    return response
+
+
+class AsyncCacheClient(object):
+    ''' Minimal non-blocking HTTP/1.1 client for the cache server, keeping a
+    pool of idle keep-alive connections. Used by the asyncio crawler. '''
+
+    def __init__(self, config):
+        self.config = config
+        self.idle = list()
+
+    async def _connect(self):
+        host, port = self.config.cache_server
+        return await asyncio.open_connection(host, port)
+
+    async def get(self, url):
+        ''' Returns (status code, body, new connections made) for the cache
+        server's answer. '''
+        host, port = self.config.cache_server
+        query = urlencode([("q", url), ("u", self.config.user_agent)])
+        request = (
+            f"GET /?{query} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            f"Connection: keep-alive\r\n\r\n").encode("latin-1")
+        reused = bool(self.idle)
+        reader, writer = self.idle.pop() if reused else await self._connect()
+        connected = 0 if reused else 1
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line and reused:
+                # The server closed the idle connection, use a fresh one.
+                writer.close()
+                reader, writer = await self._connect()
+                connected += 1
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+            status_code, body, keep_alive = await self._read_response(
+                status_line, reader)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return status_code, body, connected
+
+    async def _read_response(self, status_line, reader):
+        parts = status_line.decode("latin-1").split()
+        if len(parts) < 2:
+            raise ConnectionError("Cache server closed the connection.")
+        status_code = int(parts[1])
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        keep_alive = (
+            parts[0] == "HTTP/1.1"
+            and headers.get("connection", "").lower() != "close")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = list()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status_code, body, keep_alive
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+async def download_async(url, config, client, logger=None):
+    ''' download() for the asyncio crawler, with the same retries. '''
+    connections = 0
+    start = time.monotonic()
+    retries = 0
+    while True:
+        try:
+            status_code, body, connected = await asyncio.wait_for(
+                client.get(url), config.download_timeout)
+            connections += connected
+            response, error = _decode(url, status_code, body)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            error = f"Spacetime connection error {e!r} with url {url}."
+            response = Response({"error": error, "status": None, "url": url})
+        if not _is_transient(response, error) or retries >= config.download_retries:
+            break
+        await asyncio.sleep(_backoff(config, retries))
+        retries += 1
+    latency = time.monotonic() - start
+    stats.record(latency, retries, connections, error is not None)
+    metrics.observe_value("download", latency)
+    if error and logger:
+        logger.error(error)
+    return response
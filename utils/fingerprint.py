@@ -0,0 +1,184 @@
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+from urllib.parse import urlparse
+
+
+SIMHASH_BITS = 64
+# Width of one per-bit counter in the packed SimHash accumulator.
+LANE_BITS = 32
+LANE_MASK = (1 << LANE_BITS) - 1
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_lanes(word):
+    # The 64 bit hash of word with bit i moved to bit LANE_BITS * i, so that
+    # adding these up counts every bit position in a single big int.
+    h = int.from_bytes(
+        blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    lanes = 0
+    for bit in range(SIMHASH_BITS):
+        if h >> bit & 1:
+            lanes |= 1 << (bit * LANE_BITS)
+    return lanes
+
+
+def content_hash(words):
+    ''' Exact fingerprint of a word stream. '''
+    digest = blake2b(digest_size=8)
+    for word in words:
+        digest.update(word.encode("utf-8"))
+        digest.update(b" ")
+    return int.from_bytes(digest.digest(), "little")
+
+
+def simhash(words):
+    ''' 64 bit SimHash of a word stream, weighted by term frequency. Pages
+    that share most of their words get fingerprints a few bits apart. '''
+    totals = 0
+    for word, count in Counter(words).items():
+        totals += _word_lanes(word) * count
+    half = len(words) / 2
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if (totals >> (bit * LANE_BITS)) & LANE_MASK > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class SimHashIndex(object):
+    ''' Finds fingerprints within max_distance bits of a query.
+
+    The fingerprint is split into max_distance + 1 bands. Two fingerprints
+    that differ in at most max_distance bits agree exactly on at least one
+    band, so only fingerprints sharing a band are compared. Each band bucket
+    is a compact array of 64 bit fingerprints. '''
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-SIMHASH_BITS // self.bands)
+        self.band_mask = (1 << self.band_bits) - 1
+        self.buckets = [dict() for _ in range(self.bands)]
+        self.count = 0
+
+    def _keys(self, fingerprint):
+        for band in range(self.bands):
+            yield (fingerprint >> (band * self.band_bits)) & self.band_mask
+
+    def find(self, fingerprint):
+        for buckets, key in zip(self.buckets, self._keys(fingerprint)):
+            for other in buckets.get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, fingerprint):
+        for buckets, key in zip(self.buckets, self._keys(fingerprint)):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = array("Q")
+            bucket.append(fingerprint)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def fingerprints(self):
+        ''' Every fingerprint added, each is in exactly one first band
+        bucket. '''
+        fingerprints = array("Q")
+        for bucket in self.buckets[0].values():
+            fingerprints.extend(bucket)
+        return fingerprints
+
+
+class DuplicateDetector(object):
+    ''' Flags pages whose words are an exact or near copy of a page seen
+    before, and keeps per-host duplicate counts. Pages with fewer than
+    min_words words are not fingerprinted, since short pages look alike.
+    A max_distance below 0 turns off near-duplicate detection. The state is
+    saved with the frontier's checkpoints. '''
+    UNIQUE = None
+    EXACT = "exact"
+    NEAR = "near"
+
+    def __init__(self, max_distance=3, min_words=50):
+        self.min_words = min_words
+        self.exact = set()
+        self.near = SimHashIndex(max_distance) if max_distance >= 0 else None
+        # host -> [pages fingerprinted, exact duplicates, near duplicates]
+        self.host_stats = defaultdict(lambda: [0, 0, 0])
+        self.lock = Lock()
+
+    def fingerprint(self, words):
+        ''' (exact hash, SimHash) of a page's words, or None if the page is too
+        short to fingerprint. Does not touch the index, so it can run in
+        another process. '''
+        if len(words) < self.min_words:
+            return None
+        return (
+            content_hash(words),
+            simhash(words) if self.near is not None else None)
+
+    def check(self, url, words):
+        ''' Records the page and returns EXACT or NEAR if it duplicates a page
+        seen before, UNIQUE otherwise. '''
+        return self.check_fingerprint(url, self.fingerprint(words))
+
+    def check_fingerprint(self, url, fingerprint):
+        if fingerprint is None:
+            return self.UNIQUE
+        exact, near = fingerprint
+        host = (urlparse(url).hostname or "").lower()
+        with self.lock:
+            stats = self.host_stats[host]
+            stats[0] += 1
+            if exact in self.exact:
+                stats[1] += 1
+                return self.EXACT
+            self.exact.add(exact)
+            if near is None:
+                return self.UNIQUE
+            if self.near.find(near) is not None:
+                stats[2] += 1
+                return self.NEAR
+            self.near.add(near)
+            return self.UNIQUE
+
+    def get_state(self):
+        ''' Picklable snapshot of the fingerprints seen and the per-host
+        counts, for checkpoints. '''
+        with self.lock:
+            return {
+                "exact": array("Q", self.exact).tobytes(),
+                "near": (
+                    self.near.fingerprints().tobytes()
+                    if self.near is not None else b""),
+                "host_stats": {
+                    host: list(stats) for host, stats in self.host_stats.items()}}
+
+    def set_state(self, state):
+        ''' Replaces the state with a snapshot from get_state. '''
+        exact = array("Q")
+        exact.frombytes(state["exact"])
+        near = array("Q")
+        near.frombytes(state["near"])
+        with self.lock:
+            self.exact = set(exact)
+            if self.near is not None:
+                self.near = SimHashIndex(self.near.max_distance)
+                for fingerprint in near:
+                    self.near.add(fingerprint)
+            self.host_stats.clear()
+            self.host_stats.update(state["host_stats"])
+
+    def write_stats_to_file(self, filename="Logs/DUPLICATES.txt"):
+        with self.lock:
+            rows = sorted(self.host_stats.items())
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("host, pages, exact duplicates, near duplicates, duplicate rate\n")
+            for host, (pages, exact, near) in rows:
+                f.write(f"{host}, {pages}, {exact}, {near}, {(exact + near) / pages:.3f}\n")
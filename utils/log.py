@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+
+from logging.handlers import QueueHandler
+from queue import SimpleQueue, Empty
+from threading import Thread, Event, Lock
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Most records written in one go.
+BATCH = 1024
+
+
+class LogWriter(Thread):
+    ''' Formats and writes the log records and crawl events of the whole
+    process, away from the threads that log them.
+
+    Loggers only put records on a queue (see get_logger). This thread takes
+    everything that is waiting, up to BATCH records at once, writes each
+    record to Logs/<file>.log and to the console, and events to the event
+    log as JSON lines, then flushes every file once per batch. '''
+
+    def __init__(self):
+        super().__init__(name="LogWriter", daemon=True)
+        self.queue = SimpleQueue()
+        self.formatter = logging.Formatter(FORMAT)
+        self.console = True
+        self.event_log = ""
+        self.files = dict()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < BATCH:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                pass
+            if not self._write(batch):
+                break
+        for f in self.files.values():
+            f.close()
+        self.files = dict()
+
+    def _file(self, path):
+        f = self.files.get(path)
+        if f is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            f = self.files[path] = open(path, "a", encoding="utf-8")
+        return f
+
+    def _write(self, batch):
+        # Returns False once the stop marker was written.
+        running = True
+        console = list()
+        touched = set()
+        flushed = list()
+        for item in batch:
+            if item is None:
+                running = False
+            elif isinstance(item, Event):
+                flushed.append(item)
+            elif isinstance(item, dict):
+                if self.event_log:
+                    self._file(self.event_log).write(
+                        json.dumps(item, separators=(",", ":")) + "\n")
+                    touched.add(self.event_log)
+            else:
+                line = self.formatter.format(item)
+                path = f"Logs/{item.log_file}.log"
+                self._file(path).write(line + "\n")
+                touched.add(path)
+                if self.console:
+                    console.append(line)
+        for path in touched:
+            self.files[path].flush()
+        if console:
+            sys.stderr.write("\n".join(console) + "\n")
+            sys.stderr.flush()
+        for event in flushed:
+            event.set()
+        return running
+
+
+class _QueueHandler(QueueHandler):
+    # Tags every record with the file it goes to.
+    def __init__(self, queue, log_file):
+        super().__init__(queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+
+_writer = None
+_writer_lock = Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            _writer.start()
+            atexit.register(stop_logging)
+        return _writer
+
+
+def get_logger(name, filename=None):
+    ''' A logger whose records go to Logs/<filename or name>.log and to the
+    console through the LogWriter thread. Only one handler is ever attached
+    to a logger, however often it is asked for. '''
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    # The report and the stats files are written to Logs/ as well.
+    os.makedirs("Logs", exist_ok=True)
+    if not any(isinstance(handler, _QueueHandler) for handler in logger.handlers):
+        logger.addHandler(_QueueHandler(_get_writer().queue, filename or name))
+        logger.propagate = False
+    return logger
+
+
+def configure_logging(config):
+    writer = _get_writer()
+    writer.console = config.log_console
+    writer.event_log = config.event_log
+
+
+def log_event(event, **fields):
+    ''' Appends {"t": time, "event": event, **fields} to the event log, if
+    one is configured. '''
+    writer = _writer
+    if writer is None or not writer.event_log:
+        return
+    writer.queue.put({"t": round(time.time(), 3), "event": event, **fields})
+
+
+def flush_logs(timeout=None):
+    ''' Waits until everything logged so far is written. '''
+    writer = _writer
+    if writer is None or not writer.is_alive():
+        return
+    done = Event()
+    writer.queue.put(done)
+    done.wait(timeout)
+
+
+def stop_logging():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.is_alive():
+        writer.queue.put(None)
+        writer.join(5)
@@ -0,0 +1,208 @@
+import time
+import bisect
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+
+# Upper bounds of the histogram buckets in seconds, 0.5 ms to about a minute.
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(18))
+
+
+class Histogram(object):
+    ''' Number of observations per bucket, plus their count and sum. '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.lock = Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.total
+
+    def quantile(self, q):
+        ''' Upper bound of the bucket holding the q-th observation. '''
+        counts, count, _ = self.snapshot()
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen and seen >= q * count:
+                return bound
+        return 0.0
+
+
+class Metrics(object):
+    ''' Timings and counters of the crawler's hot path.
+
+    Stages are timed with clock() and observe(), and kept in histograms.
+    Gauges are read from their source only when the metrics are reported.
+    Every interval seconds a summary line is logged and the metrics are
+    written to stats_file in the Prometheus text format, which is also
+    served on port if it is set. When disabled, clock() and observe() return
+    right away and nothing is reported. '''
+
+    def __init__(self):
+        self.enabled = True
+        self.interval = 30.0
+        self.port = 0
+        self.stats_file = "Logs/METRICS.prom"
+        self.histograms = dict()
+        # (name, labels) -> value
+        self.counters = Counter()
+        # name -> (label name, function returning {label: value})
+        self.gauges = dict()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.server = None
+
+    def configure(self, config):
+        self.enabled = config.metrics
+        self.interval = config.metrics_interval
+        self.port = config.metrics_port
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe(self, name, start):
+        ''' Records the seconds since start, a clock() reading. '''
+        if self.enabled:
+            self.observe_value(name, time.perf_counter() - start)
+
+    def observe_value(self, name, seconds):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def add_gauge(self, name, label, source):
+        self.gauges[name] = (label, source)
+
+    def summary(self):
+        parts = list()
+        for name, histogram in sorted(self.histograms.items()):
+            _, count, total = histogram.snapshot()
+            if count:
+                parts.append(
+                    f"{name} n={count} avg={total / count * 1000:.1f}ms "
+                    f"p50<={histogram.quantile(0.5) * 1000:g}ms "
+                    f"p95<={histogram.quantile(0.95) * 1000:g}ms")
+        with self.lock:
+            totals = Counter()
+            for (name, _), value in self.counters.items():
+                totals[name] += value
+        parts.extend(f"{name}={value}" for name, value in sorted(totals.items()))
+        for name, (label, source) in sorted(self.gauges.items()):
+            values = source()
+            parts.append(
+                f"{name} total={sum(values.values())} {label}s={len(values)} "
+                f"max={max(values.values(), default=0)}")
+        return "; ".join(parts)
+
+    def render(self):
+        ''' The metrics in the Prometheus text format. '''
+        lines = list()
+        for name, histogram in sorted(self.histograms.items()):
+            counts, count, total = histogram.snapshot()
+            metric = f"crawler_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum {total}")
+            lines.append(f"{metric}_count {count}")
+        with self.lock:
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"crawler_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        for name, (label, source) in sorted(self.gauges.items()):
+            metric = f"crawler_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            for key, value in sorted(source().items()):
+                lines.append(f"{metric}{_labels(((label, key),))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_stats_to_file(self, filename=None):
+        if not self.enabled:
+            return
+        with open(filename or self.stats_file, "w", encoding="utf-8") as f:
+            f.write(self.render())
+
+    def start(self, logger):
+        ''' Starts reporting every interval seconds, and serving the metrics
+        if a port is set. '''
+        if not self.enabled or self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self._report, args=(logger,), daemon=True)
+        self.thread.start()
+        if self.port:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), _Handler)
+            self.server.metrics = self
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def _report(self, logger):
+        while not self.stopped.wait(self.interval):
+            logger.info(f"Metrics: {self.summary()}")
+            self.write_stats_to_file()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+metrics = Metrics()
@@ -5,10 +5,24 @@ class Response(object):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # The pickled requests.Response is only unpickled when raw_response
+        # is first read, so responses that are gated on their size are never
+        # unpickled. size is the length of the pickled payload.
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+        self.size = len(self._pickled) if isinstance(self._pickled, bytes) else 0
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
@@ -0,0 +1,291 @@
+import re
+import gzip
+import time
+import heapq
+from threading import Lock
+from urllib.parse import urlparse, urlsplit, urljoin
+
+from lxml import etree
+
+from utils.download import download
+from utils.metrics import metrics
+
+
+class RobotsRules(object):
+    ''' The rules of one robots.txt for our user agent.
+
+    Rules without wildcards are kept in a character trie, so finding the
+    longest rule that matches a path walks the path once. The few rules
+    with * or $ are checked as regular expressions. As in RFC 9309, the
+    longest matching rule wins and allow wins a tie. '''
+
+    def __init__(self, text="", user_agent=""):
+        self.text = text
+        self.crawl_delay = None
+        self.sitemaps = list()
+        # char -> child node, plus None -> (length, allow) on rule ends.
+        self.trie = dict()
+        # (length, allow, compiled pattern)
+        self.patterns = list()
+        self._parse(text, user_agent.lower())
+
+    def _parse(self, text, user_agent):
+        # Groups as {agent: [(field, value), ...]}. Consecutive user-agent
+        # lines share the group that follows them.
+        groups = dict()
+        agents = list()
+        in_rules = False
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            field = field.strip().lower()
+            value = value.strip()
+            if field == "sitemap":
+                if value:
+                    self.sitemaps.append(value)
+            elif field == "user-agent":
+                if in_rules:
+                    agents = list()
+                    in_rules = False
+                agents.append(value.lower())
+                groups.setdefault(value.lower(), list())
+            elif field in ("allow", "disallow", "crawl-delay"):
+                in_rules = True
+                for agent in agents:
+                    groups[agent].append((field, value))
+
+        # The most specific group naming us, else the * group.
+        names = [
+            agent for agent in groups
+            if agent != "*" and agent and agent in user_agent]
+        if names:
+            rules = groups[max(names, key=len)]
+        else:
+            rules = groups.get("*", ())
+        for field, value in rules:
+            if field == "crawl-delay":
+                try:
+                    self.crawl_delay = float(value)
+                except ValueError:
+                    pass
+            elif value:
+                self._add_rule(value, field == "allow")
+
+    def _add_rule(self, rule, allow):
+        if "*" in rule or rule.endswith("$"):
+            anchored = rule.endswith("$")
+            body = rule[:-1] if anchored else rule
+            pattern = ".*".join(map(re.escape, body.split("*")))
+            self.patterns.append((
+                len(rule), allow,
+                re.compile(pattern + ("$" if anchored else ""))))
+            return
+        node = self.trie
+        for char in rule:
+            node = node.setdefault(char, dict())
+        node[None] = max(node.get(None, (0, False)), (len(rule), allow))
+
+    def allows(self, path):
+        ''' Whether path (with its query) may be fetched. '''
+        best = None
+        node = self.trie
+        if None in node:
+            best = node[None]
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                best = node[None]
+        for length, allow, pattern in self.patterns:
+            if pattern.match(path) and (
+                    best is None or (length, allow) > best):
+                best = (length, allow)
+        return best is None or best[1]
+
+
+class RobotsCache(object):
+    ''' robots.txt rules and sitemaps of every host, fetched through the
+    cache server the first time a url of the host is about to be downloaded,
+    and again after ttl seconds. A robots.txt that could not be downloaded
+    allows everything for ERROR_TTL seconds, one that does not exist (4xx)
+    for ttl seconds. Sitemaps are only read once a robots.txt was downloaded,
+    at most MAX_SITEMAPS files per host. These fetches are spaced out by the
+    host's politeness delay, as is the page download that follows them.
+
+    allows only reads the cache, so it is cheap enough for is_valid. check
+    is the blocking part the workers call. The state is saved with the
+    frontier's checkpoints as robots.txt texts. '''
+    ERROR_TTL = 600
+    MAX_SITEMAPS = 50
+
+    def __init__(self, config):
+        self.config = config
+        self.ttl = config.robots_ttl
+        self.max_crawl_delay = config.robots_max_crawl_delay
+        self.sitemap_urls = config.robots_sitemap_urls
+        # host -> [RobotsRules, expires at, sitemaps read]
+        self.hosts = dict()
+        # host -> Lock held while its robots.txt is fetched
+        self.fetching = dict()
+        self.lock = Lock()
+
+    def _entry(self, host):
+        entry = self.hosts.get(host)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry
+
+    def allows(self, url, parsed=None):
+        ''' False if the cached rules of url's host disallow it. Unknown
+        hosts are allowed until their robots.txt has been read. parsed is
+        urlparse(url), if the caller already has it. '''
+        if parsed is None:
+            parsed = urlparse(url)
+        entry = self.hosts.get((parsed.hostname or "").lower())
+        if entry is None:
+            return True
+        path = parsed.path
+        if parsed.params:
+            path = f"{path};{parsed.params}"
+        path = path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        return entry[0].allows(path)
+
+    def crawl_delay(self, host):
+        ''' Crawl-delay of host, capped to max_crawl_delay, or None. '''
+        entry = self.hosts.get(host)
+        if entry is None or entry[0].crawl_delay is None:
+            return None
+        return min(entry[0].crawl_delay, self.max_crawl_delay)
+
+    def check(self, url, logger=None):
+        ''' Fetches the robots.txt of url's host if it is not cached or has
+        expired, and its sitemaps the first time. Returns (allowed, urls
+        found in the sitemaps, newest first). '''
+        parsed = urlsplit(url)
+        host = (parsed.hostname or "").lower()
+        found = list()
+        if self._entry(host) is None:
+            with self.lock:
+                host_lock = self.fetching.setdefault(host, Lock())
+            with host_lock:
+                # Another worker may have fetched it meanwhile.
+                if self._entry(host) is None:
+                    found = self._fetch(parsed.scheme, host, logger)
+        return self.allows(url), found
+
+    def _fetch(self, scheme, host, logger):
+        robots_url = f"{scheme}://{host}/robots.txt"
+        resp = download(robots_url, self.config, logger)
+        text = _content(resp)
+        ttl = self.ttl
+        found = text is not None
+        if text is None:
+            text = ""
+            if resp.status is None or resp.status >= 500:
+                ttl = min(self.ttl, self.ERROR_TTL)
+        metrics.count("robots_fetches", status=str(resp.status))
+        rules = RobotsRules(text, self.config.user_agent)
+        previous = self.hosts.get(host)
+        sitemaps_read = previous is not None and previous[2]
+        self.hosts[host] = [rules, time.time() + ttl, sitemaps_read or found]
+        urls = list()
+        if found and not sitemaps_read and self.sitemap_urls:
+            sitemaps = rules.sitemaps or [f"{scheme}://{host}/sitemap.xml"]
+            urls = self._read_sitemaps(host, sitemaps, logger)
+        # The worker downloads the page right after.
+        self._wait(host)
+        return urls
+
+    def _wait(self, host):
+        # Politeness between two fetches from host, see Frontier._host_delay.
+        time.sleep(max(self.config.time_delay, self.crawl_delay(host) or 0))
+
+    def _read_sitemaps(self, host, sitemaps, logger):
+        # Sitemap indexes are followed one level deep. Only the newest
+        # sitemap_urls entries are kept, in a heap of (lastmod, order, loc).
+        entries = list()
+        listed = 0
+        queue = [(url, 0) for url in sitemaps]
+        fetched = 0
+        while queue and fetched < self.MAX_SITEMAPS:
+            sitemap_url, depth = queue.pop(0)
+            fetched += 1
+            self._wait(host)
+            text = _content(download(sitemap_url, self.config, logger), binary=True)
+            if text is None:
+                continue
+            for kind, loc, lastmod in _parse_sitemap(text):
+                loc = urljoin(sitemap_url, loc)
+                if kind == "sitemap":
+                    if depth < 1:
+                        queue.append((loc, depth + 1))
+                    continue
+                # Of equal lastmod, the entry listed first is kept.
+                listed += 1
+                entry = (lastmod, -listed, loc)
+                if len(entries) < self.sitemap_urls:
+                    heapq.heappush(entries, entry)
+                else:
+                    heapq.heappushpop(entries, entry)
+        metrics.count("sitemap_urls", len(entries))
+        # Newest first, so the pages most likely to have changed come first.
+        entries.sort(reverse=True)
+        return [loc for _, _, loc in entries]
+
+    def get_state(self):
+        return {
+            host: (rules.text, expires, sitemaps_read)
+            for host, (rules, expires, sitemaps_read) in list(self.hosts.items())}
+
+    def set_state(self, state):
+        for host, (text, expires, sitemaps_read) in state.items():
+            self.hosts[host] = [
+                RobotsRules(text, self.config.user_agent), expires, sitemaps_read]
+
+
+def _content(resp, binary=False):
+    # Body of a successful response, or None.
+    if resp.status != 200:
+        return None
+    content = getattr(resp.raw_response, "content", None)
+    if content is None:
+        return None
+    if binary:
+        return content
+    return content.decode("utf-8", errors="ignore")
+
+
+def _parse_sitemap(content):
+    # Yields ("url" or "sitemap", loc, lastmod) from a sitemap or an index.
+    if content[:2] == b"\x1f\x8b":
+        try:
+            content = gzip.decompress(content)
+        except OSError:
+            return
+    try:
+        root = etree.fromstring(
+            content, etree.XMLParser(recover=True, resolve_entities=False))
+    except (etree.XMLSyntaxError, ValueError):
+        return
+    if root is None:
+        return
+    for element in root:
+        kind = etree.QName(element).localname if isinstance(element.tag, str) else ""
+        if kind not in ("url", "sitemap"):
+            continue
+        loc = lastmod = ""
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            name = etree.QName(child).localname
+            if name == "loc":
+                loc = (child.text or "").strip()
+            elif name == "lastmod":
+                lastmod = (child.text or "").strip()
+        if loc:
+            yield kind, loc, lastmod
@@ -0,0 +1,127 @@
+import re
+from collections import defaultdict
+from threading import Lock
+from urllib.parse import urlparse, parse_qsl
+
+
+_DIGITS = re.compile(r"\d+")
+
+
+def url_template(url, parsed=None):
+    ''' Groups urls that only differ in numbers or query values, for example
+    calendar days or page numbers: www.ics.uci.edu/events/<n>-<n>-<n>?page=<v>
+    Returns None for urls without numbers or query values, which are
+    templates of their own and so cannot be traps. parsed is urlparse(url),
+    if the caller already has it. '''
+    if parsed is None:
+        parsed = urlparse(url)
+    path = _DIGITS.sub("<n>", parsed.path)
+    keys = sorted({key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+    if path == parsed.path and not keys:
+        return None
+    query = "&".join(f"{key}=<v>" for key in keys)
+    return f"{(parsed.hostname or '').lower()}{path}?{query}"
+
+
+class TrapDetector(object):
+    ''' Learns crawler traps instead of listing them by hand.
+
+    Every url is mapped to its template. A template is cut off once budget
+    of its urls have been admitted to the frontier, or once min_samples of
+    its pages have been downloaded and less than min_novelty of them had new
+    content (not a duplicate). Pages too short to fingerprint say nothing
+    about novelty and are not counted. A budget of 0 turns the detector off.
+    The state is saved with the frontier's checkpoints. '''
+
+    def __init__(self, budget=1000, min_samples=20, min_novelty=0.1):
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_novelty = min_novelty
+        self.admitted = defaultdict(int)
+        # template -> [pages downloaded, pages with new content]
+        self.yielded = defaultdict(lambda: [0, 0])
+        # template -> reason it was cut off
+        self.blocked = dict()
+        self.lock = Lock()
+
+    def admit(self, url):
+        ''' Called by the frontier for every new url. Returns False if the
+        url belongs to a template that has been cut off. '''
+        if not self.budget:
+            return True
+        template = url_template(url)
+        if template is None:
+            return True
+        with self.lock:
+            if template in self.blocked:
+                return False
+            self.admitted[template] += 1
+            if self.admitted[template] >= self.budget:
+                self.blocked[template] = f"over budget of {self.budget} urls"
+            return True
+
+    def record_page(self, url, novel):
+        ''' Called by the scraper for every downloaded page, with whether it
+        had new content, or None if that is not known. '''
+        if not self.budget or novel is None:
+            return
+        template = url_template(url)
+        if template is None:
+            return
+        with self.lock:
+            pages = self.yielded[template]
+            pages[0] += 1
+            pages[1] += bool(novel)
+            if (template not in self.blocked
+                    and pages[0] >= self.min_samples
+                    and pages[1] < self.min_novelty * pages[0]):
+                self.blocked[template] = (
+                    f"{pages[1]} of {pages[0]} pages had new content")
+
+    def is_blocked(self, url, parsed=None):
+        return bool(self.budget) and url_template(url, parsed) in self.blocked
+
+    def is_unproductive(self, url):
+        ''' Whether url's template was cut off because too few of its pages
+        had new content. Urls admitted within a template's budget are still
+        worth fetching once the budget runs out, these are not. '''
+        if not self.budget:
+            return False
+        template = url_template(url)
+        with self.lock:
+            pages = self.yielded.get(template)
+            return (pages is not None
+                    and pages[0] >= self.min_samples
+                    and pages[1] < self.min_novelty * pages[0])
+
+    def get_state(self):
+        ''' Picklable snapshot of the counts and cut off templates, for
+        checkpoints. '''
+        with self.lock:
+            return {
+                "admitted": dict(self.admitted),
+                "yielded": {
+                    template: list(pages)
+                    for template, pages in self.yielded.items()},
+                "blocked": dict(self.blocked)}
+
+    def set_state(self, state):
+        ''' Replaces the state with a snapshot from get_state. '''
+        with self.lock:
+            self.admitted.clear()
+            self.admitted.update(state["admitted"])
+            self.yielded.clear()
+            self.yielded.update(state["yielded"])
+            self.blocked = dict(state["blocked"])
+
+    def write_stats_to_file(self, filename="Logs/TRAPS.txt"):
+        with self.lock:
+            rows = sorted(self.blocked.items())
+            stats = {
+                template: (self.admitted[template], *self.yielded[template])
+                for template, _ in rows}
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("template, urls admitted, pages downloaded, pages with new content, reason\n")
+            for template, reason in rows:
+                admitted, pages, novel = stats[template]
+                f.write(f"{template}, {admitted}, {pages}, {novel}, {reason}\n")
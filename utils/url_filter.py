@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+
+
+class URLFilter(object):
+    ''' Decides whether a url should be crawled, parsing it only once.
+
+    Every rule is compiled when the filter is built: the path and trap
+    patterns are each joined into one alternation, and domain decisions are
+    cached per netloc in a bounded LRU. reject_reason names the first rule
+    that rejected a url, and rejected counts rejections per rule. '''
+
+    # Rule names, in the order they are checked.
+    SCHEME = "scheme"
+    DOMAIN = "domain"
+    EXTENSION = "extension"
+    PATH = "path"
+    QUERY = "query"
+    TRAP = "trap"
+    # The rules checked by is_valid, the remaining ones only by accepts.
+    BASIC_RULES = 3
+
+    def __init__(self, schemes, domains, extension_pattern, ignored_paths,
+                 ignored_query_keys, trap_patterns, host_cache_size=4096):
+        self.schemes = frozenset(schemes)
+        self.domains = tuple(domains)
+        self.extension_re = re.compile(extension_pattern)
+        self.path_re = _combine(ignored_paths)
+        self.query_keys = frozenset(ignored_query_keys)
+        self.trap_re = _combine(trap_patterns)
+        self._host_allowed = lru_cache(maxsize=host_cache_size)(
+            self._check_host)
+        self.rejected = Counter()
+        self._lock = Lock()
+
+    def _check_host(self, netloc):
+        return netloc.lower().endswith(self.domains)
+
+    def reject_reason(self, url, basic=False, parsed=None):
+        ''' Name of the first rule that rejects url, None if it is accepted.
+        With basic, only the scheme, domain and extension rules are checked.
+        parsed is urlparse(url), if the caller already has it. '''
+        if parsed is None:
+            parsed = urlparse(url)
+        reason = self._reject_reason(parsed, basic)
+        if reason is not None:
+            with self._lock:
+                self.rejected[reason] += 1
+        return reason
+
+    def _reject_reason(self, parsed, basic):
+        if parsed.scheme not in self.schemes:
+            return self.SCHEME
+        if not self._host_allowed(parsed.netloc):
+            return self.DOMAIN
+        path = parsed.path
+        if self.extension_re.match(path.lower()):
+            return self.EXTENSION
+        if basic:
+            return None
+        if self.path_re is not None and self.path_re.search(path):
+            return self.PATH
+        if parsed.query and not self.query_keys.isdisjoint(
+                parse_qs(parsed.query)):
+            return self.QUERY
+        if self.trap_re is not None and self.trap_re.search(path):
+            return self.TRAP
+        return None
+
+    def is_valid(self, url):
+        return self.reject_reason(url, basic=True) is None
+
+    def accepts(self, url):
+        return self.reject_reason(url) is None
+
+    def host_cache_info(self):
+        return self._host_allowed.cache_info()
+
+
+def _combine(patterns):
+    # One alternation instead of a search per pattern. Each pattern is
+    # wrapped in its own group so alternation binds the way it did alone.
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))